@@ -0,0 +1,561 @@
+"""
+Benchmark suite for the cost / environmental engines and the fleet API.
+
+Each case is timed over several repeats (latency p50/p95/p99, throughput)
+plus one extra run under tracemalloc for peak memory. The instrumented
+stages hit during the timed repeats (simulate_cost_distribution,
+compute_stats, serialize, ...; see metrics.py) are reported per case as
+calls and milliseconds per run. Results are written as JSON so they can
+be kept as baselines and compared later.
+
+Synthetic data is seeded, so the same preset always benchmarks the same
+inputs. The API cases need a scratch Postgres: set BENCH_DATABASE_URL and
+the suite creates and seeds fleet_decisions_full_6 there (never point it
+at the production database).
+
+Usage:
+    python benchmark.py run [--preset quick|full] [--only PREFIX] [--out FILE]
+    python benchmark.py compare BASELINE CURRENT [--threshold 0.10]
+"""
+
+import argparse
+import atexit
+import csv
+import functools
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+import metrics
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "old"))
+
+from cost_engine import (  # noqa: E402
+    ScenarioRow,
+    compute_stats,
+    evaluate_scenario,
+    read_scenarios_from_csv,
+    simulate_cost_distribution,
+)
+from environmental_engine import compute_truck_environmental_impact  # noqa: E402
+from rolling_engine import replay_fleet  # noqa: E402
+
+PRESETS = {
+    "quick": {
+        "samples": [1_000, 20_000, 100_000],
+        "trucks": [10, 1_000],
+        "eval_trucks": 10,
+        "trip_ticks": 50,
+        "api_trucks": [10, 1_000],
+        "repeats": 5,
+    },
+    "full": {
+        "samples": [1_000, 20_000, 100_000, 1_000_000],
+        "trucks": [10, 1_000, 10_000, 100_000],
+        "eval_trucks": 100,
+        "trip_ticks": 200,
+        "api_trucks": [10, 1_000, 10_000, 100_000],
+        "repeats": 10,
+    },
+}
+
+SCENARIO_FIELDS = [
+    "truck_id", "node_id", "minutes_above_temp", "future_violation_if_continue",
+    "reroute_reduction", "detour_repair_benefit", "slack_minutes", "door_open",
+    "high_humidity", "distance_base_miles", "delay_base_minutes",
+    "spoilage_time_base_hours", "shipment_value", "recommended_action", "t",
+]
+
+
+# ── Synthetic fleet generators ───────────────────────────────────────
+
+def synthetic_scenarios(n_trucks: int, seed: int = 0, ticks: int = 1) -> List[ScenarioRow]:
+    """Seeded ScenarioRows: n_trucks × ticks, slowly drifting per truck."""
+    rng = np.random.default_rng(seed)
+    rows: List[ScenarioRow] = []
+    for truck_id in range(1, n_trucks + 1):
+        base = {
+            "distance_base_miles": float(rng.uniform(20, 400)),
+            "delay_base_minutes": float(rng.uniform(0, 60)),
+            "spoilage_time_base_hours": float(rng.uniform(0, 6)),
+            "shipment_value": float(rng.uniform(50_000, 100_000)) if rng.random() < 0.8 else None,
+        }
+        minutes_above = 0.0
+        for tick in range(ticks):
+            minutes_above += float(rng.choice([0.0, 0.0, 0.0, 5.0]))
+            rows.append(ScenarioRow(
+                truck_id=truck_id,
+                node_id=int(rng.integers(1, 500)),
+                minutes_above_temp=minutes_above,
+                future_violation_if_continue=float(rng.uniform(0, 60)),
+                reroute_reduction=float(rng.uniform(0, 30)),
+                detour_repair_benefit=float(rng.uniform(0, 60)),
+                slack_minutes=float(rng.uniform(0, 30)),
+                door_open=int(rng.random() < 0.1),
+                high_humidity=int(rng.random() < 0.2),
+                t=float(tick * 60),
+                **base,
+            ))
+    return rows
+
+
+def synthetic_fleet_rows(n_trucks: int, seed: int = 0) -> List[Dict[str, Any]]:
+    """Seeded rows with every fleet_decisions_full_6 column (one per truck)."""
+    rng = np.random.default_rng(seed)
+    t0 = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    actions = ["continue", "reroute", "detour"]
+    rows = []
+    for truck_id in range(1, n_trucks + 1):
+        costs = rng.uniform(500, 50_000, 3)
+        best = int(np.argmin(costs))
+        next_nodes = [int(v) for v in rng.integers(1, 500, 3)]
+        valid_next = sorted({*next_nodes, *(int(v) for v in rng.integers(1, 500, 2))})
+        components = rng.dirichlet(np.ones(3), 3) * costs[:, None]
+        all_actions = [
+            {
+                "action": a,
+                "next_node": nn,
+                "mean_cost": float(c),
+                "score": float(c * rng.uniform(0.9, 1.1)),
+                "mean_cost_components": {
+                    "operating_travel": float(comp[0]),
+                    "delay_service": float(comp[1]),
+                    "spoilage": float(comp[2]),
+                },
+            }
+            for a, nn, c, comp in zip(actions, next_nodes, costs, components)
+        ]
+        rows.append({
+            "truck_id": truck_id,
+            "ts": t0 + timedelta(seconds=int(rng.integers(0, 86_400))),
+            "latitude": float(rng.uniform(25, 49)),
+            "longitude": float(rng.uniform(-124, -67)),
+            "speed_mph": float(rng.uniform(0, 70)),
+            "current_node": int(rng.integers(1, 500)),
+            "planned_next": next_nodes[0],
+            "chosen_next": next_nodes[best],
+            "destination_node": int(rng.integers(1, 500)),
+            "valid_outgoing_next_nodes_json": json.dumps(valid_next),
+            "edge_progress_frac": float(rng.random()),
+            "is_facility_node": int(rng.random() < 0.05),
+            "edge_travel_time_min": float(rng.uniform(5, 240)),
+            "door_open": int(rng.random() < 0.1),
+            "humidity_pct": float(rng.uniform(20, 95)),
+            "remaining_slack_min": float(rng.uniform(-30, 120)),
+            "temperature_c": float(rng.uniform(-2, 10)),
+            "shipment_value": round(float(rng.uniform(50_000, 100_000)), 2),
+            "violation_min": float(rng.uniform(0, 60)),
+            "recommended_action": actions[best],
+            "best_action": actions[best],
+            "best_mean_cost": float(costs[best]),
+            "mean_total_cost": float(costs.mean()),
+            "reason": (
+                f"Selected '{actions[best]}' because it minimizes p50 cost "
+                f"(${costs[best]:,.0f}) at 50% Balanced risk tolerance"
+            ),
+            "mc_samples": 20_000,
+            "all_actions_json": json.dumps(all_actions),
+            "continue_next_node": next_nodes[0],
+            "continue_mean_total": float(costs[0]),
+            "reroute_next_node": next_nodes[1],
+            "reroute_mean_total": float(costs[1]),
+            "detour_next_node": next_nodes[2],
+            "detour_mean_total": float(costs[2]),
+        })
+    return rows
+
+
+def write_scenarios_csv(rows: List[ScenarioRow], path: str) -> None:
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(SCENARIO_FIELDS)
+        for r in rows:
+            writer.writerow(["" if getattr(r, k) is None else getattr(r, k) for k in SCENARIO_FIELDS])
+
+
+# ── Seeded Postgres fixture for the API ──────────────────────────────
+
+# Every column of fleet_decisions_full_6, in table order (FleetRow in
+# lib/fleet-from-aiven.ts), so serialize/jsonify see the real row width.
+FLEET_COLUMNS = (
+    ("truck_id", "INTEGER"),
+    ("ts", "TIMESTAMPTZ"),
+    ("latitude", "DOUBLE PRECISION"),
+    ("longitude", "DOUBLE PRECISION"),
+    ("speed_mph", "DOUBLE PRECISION"),
+    ("current_node", "INTEGER"),
+    ("planned_next", "INTEGER"),
+    ("chosen_next", "INTEGER"),
+    ("destination_node", "INTEGER"),
+    ("valid_outgoing_next_nodes_json", "TEXT"),
+    ("edge_progress_frac", "DOUBLE PRECISION"),
+    ("is_facility_node", "INTEGER"),
+    ("edge_travel_time_min", "DOUBLE PRECISION"),
+    ("door_open", "INTEGER"),
+    ("humidity_pct", "DOUBLE PRECISION"),
+    ("remaining_slack_min", "DOUBLE PRECISION"),
+    ("temperature_c", "DOUBLE PRECISION"),
+    ("shipment_value", "NUMERIC(12, 2)"),
+    ("violation_min", "DOUBLE PRECISION"),
+    ("recommended_action", "TEXT"),
+    ("best_action", "TEXT"),
+    ("best_mean_cost", "DOUBLE PRECISION"),
+    ("mean_total_cost", "DOUBLE PRECISION"),
+    ("reason", "TEXT"),
+    ("mc_samples", "INTEGER"),
+    ("all_actions_json", "TEXT"),
+    ("continue_next_node", "INTEGER"),
+    ("continue_mean_total", "DOUBLE PRECISION"),
+    ("reroute_next_node", "INTEGER"),
+    ("reroute_mean_total", "DOUBLE PRECISION"),
+    ("detour_next_node", "INTEGER"),
+    ("detour_mean_total", "DOUBLE PRECISION"),
+)
+
+FLEET_COLUMNS_SQL = ", ".join(f"{name} {sql_type}" for name, sql_type in FLEET_COLUMNS)
+
+
+def seed_fleet_table(url: str, n_trucks: int, seed: int = 0) -> None:
+    """(Re)create fleet_decisions_full_6 at url with n_trucks synthetic rows."""
+    import psycopg2
+
+    rows = synthetic_fleet_rows(n_trucks, seed)
+    buf = tempfile.SpooledTemporaryFile(mode="w+", max_size=64 * 1024 * 1024)
+    writer = csv.writer(buf)
+    names = [name for name, _ in FLEET_COLUMNS]
+    for r in rows:
+        writer.writerow([r[k].isoformat() if k == "ts" else r[k] for k in names])
+    buf.seek(0)
+
+    conn = psycopg2.connect(url)
+    try:
+        with conn.cursor() as cur:
+            cur.execute("DROP TABLE IF EXISTS fleet_decisions_full_6")
+            cur.execute(f"CREATE TABLE fleet_decisions_full_6 ({FLEET_COLUMNS_SQL})")
+            cur.copy_expert(
+                f"COPY fleet_decisions_full_6 ({', '.join(names)}) FROM STDIN WITH (FORMAT csv)",
+                buf,
+            )
+        conn.commit()
+    finally:
+        conn.close()
+
+
+# ── Measurement ──────────────────────────────────────────────────────
+
+def measure(fn: Callable[[], Any], items: int, repeats: int) -> Dict[str, Any]:
+    """Time fn over repeats (after one warm-up), then one traced run for peak memory."""
+    fn()
+
+    metrics.REGISTRY.reset()
+    latencies = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - started)
+    stages = metrics.REGISTRY.histogram_summary(metrics.STAGE_METRIC, "stage")
+
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    lat = np.array(latencies)
+    return {
+        "items": items,
+        "repeats": repeats,
+        "latency_ms": {
+            "mean": float(lat.mean() * 1e3),
+            "p50": float(np.percentile(lat, 50) * 1e3),
+            "p95": float(np.percentile(lat, 95) * 1e3),
+            "p99": float(np.percentile(lat, 99) * 1e3),
+            "min": float(lat.min() * 1e3),
+        },
+        "throughput_per_sec": float(items / np.median(lat)) if np.median(lat) > 0 else None,
+        "peak_memory_bytes": int(peak),
+        "stages": {
+            name: {"calls_per_run": calls / repeats, "ms_per_run": total * 1e3 / repeats}
+            for name, (calls, total) in sorted(stages.items(), key=lambda kv: -kv[1][1])
+        },
+    }
+
+
+# ── Cases ────────────────────────────────────────────────────────────
+#
+# A case is (name, items, build): build() prepares the case's data and
+# returns the function to time. Nothing is built for cases filtered out.
+
+Case = Tuple[str, int, Callable[[], Callable[[], Any]]]
+
+
+def _simulate_case(n: int) -> Callable[[], Any]:
+    def sim():
+        return simulate_cost_distribution(
+            distance=150.0, door_open=True, humidity=False, delay_minutes=20.0,
+            spoilage_time_hours=3.0, shipment_value=None, fixed_cost=500.0,
+            n=n, rng=np.random.default_rng(42),
+        )
+    return sim
+
+
+def _compute_stats_case(n: int) -> Callable[[], Any]:
+    costs = np.random.default_rng(42).gamma(2.0, 5_000.0, n)
+    return lambda: compute_stats(costs)
+
+
+def _evaluate_scenario_case(n: int) -> Callable[[], Any]:
+    row = synthetic_scenarios(1, seed=42)[0]
+    return lambda: evaluate_scenario(row, 0.5, n, 42)
+
+
+def _environmental_case(n: int) -> Callable[[], Any]:
+    row = synthetic_scenarios(1, seed=42)[0]
+    result = evaluate_scenario(row, 0.5, n, 42)
+    return lambda: compute_truck_environmental_impact(result, row)
+
+
+def _evaluate_fleet_case(n_trucks: int) -> Callable[[], Any]:
+    rows = synthetic_scenarios(n_trucks, seed=1)
+    return lambda: [evaluate_scenario(r, 0.5, 20_000, 42 + r.truck_id) for r in rows]
+
+
+def _replay_fleet_case(n_trucks: int, ticks: int) -> Callable[[], Any]:
+    rows = synthetic_scenarios(n_trucks, seed=2, ticks=ticks)
+    return lambda: replay_fleet(rows, 0.5, 20_000, 42)
+
+
+def _read_csv_case(n_trucks: int) -> Callable[[], Any]:
+    tmpdir = tempfile.mkdtemp(prefix="fleet_bench_")
+    atexit.register(shutil.rmtree, tmpdir, True)
+    path = os.path.join(tmpdir, f"scenarios_{n_trucks}.csv")
+    write_scenarios_csv(synthetic_scenarios(n_trucks, seed=3), path)
+    return lambda: read_scenarios_from_csv(path)
+
+
+def engine_cases(preset: Dict[str, Any]) -> List[Case]:
+    """Every engine benchmark in the preset."""
+    cases: List[Case] = []
+    for n in preset["samples"]:
+        cases += [
+            (f"simulate_cost_distribution/n={n}", n, functools.partial(_simulate_case, n)),
+            (f"compute_stats/n={n}", n, functools.partial(_compute_stats_case, n)),
+            (f"evaluate_scenario/n={n}", n, functools.partial(_evaluate_scenario_case, n)),
+            (f"compute_truck_environmental_impact/n={n}", 1,
+             functools.partial(_environmental_case, n)),
+        ]
+
+    trucks, ticks = preset["eval_trucks"], preset["trip_ticks"]
+    cases.append((
+        f"evaluate_fleet/trucks={trucks}/n=20000", trucks,
+        functools.partial(_evaluate_fleet_case, trucks),
+    ))
+    cases.append((
+        f"replay_fleet/trucks={trucks}/ticks={ticks}/n=20000", trucks * ticks,
+        functools.partial(_replay_fleet_case, trucks, ticks),
+    ))
+    for n_trucks in preset["trucks"]:
+        cases.append((
+            f"read_scenarios_from_csv/trucks={n_trucks}", n_trucks,
+            functools.partial(_read_csv_case, n_trucks),
+        ))
+    return cases
+
+
+class _BenchDatabase:
+    """Seeds the scratch table once per fleet size, however many cases use it."""
+
+    def __init__(self, server, url: str):
+        self.server = server
+        self.url = url
+        self.seeded: Optional[int] = None
+
+    def ensure(self, n_trucks: int) -> None:
+        os.environ["DATABASE_URL"] = self.url
+        self.server.SNAPSHOT_DIR = None
+        if self.seeded != n_trucks:
+            seed_fleet_table(self.url, n_trucks)
+            self.seeded = n_trucks
+
+
+def _api_cases_for(db: _BenchDatabase, client, n_trucks: int) -> List[Case]:
+    server = db.server
+
+    def fetch():
+        conn = server.get_db_connection()
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT * FROM fleet_decisions_full_6")
+                return cur.fetchall()
+        finally:
+            conn.close()
+
+    def build_fetch():
+        db.ensure(n_trucks)
+        return fetch
+
+    def build_serialize():
+        db.ensure(n_trucks)
+        rows = [dict(r) for r in fetch()]
+        return lambda: [server._row_to_dict(r) for r in rows]
+
+    def build_jsonify():
+        db.ensure(n_trucks)
+        rows = [server._row_to_dict(dict(r)) for r in fetch()]
+
+        def jsonify_rows():
+            with server.app.app_context():
+                return server.jsonify({"rows": rows}).get_data()
+        return jsonify_rows
+
+    def build_endpoint():
+        db.ensure(n_trucks)
+
+        def endpoint():
+            resp = client.get("/api/fleet-data")
+            assert resp.status_code == 200, resp.get_data(as_text=True)[:200]
+            return resp.get_data()
+        return endpoint
+
+    return [
+        (f"api/fetch/trucks={n_trucks}", n_trucks, build_fetch),
+        (f"api/serialize/trucks={n_trucks}", n_trucks, build_serialize),
+        (f"api/jsonify/trucks={n_trucks}", n_trucks, build_jsonify),
+        (f"api/fleet-data/trucks={n_trucks}", n_trucks, build_endpoint),
+    ]
+
+
+def api_cases(preset: Dict[str, Any], url: str) -> List[Case]:
+    """The server fetch / serialize / jsonify / endpoint path, per fleet size."""
+    import server
+
+    db = _BenchDatabase(server, url)
+    client = server.app.test_client()
+    cases: List[Case] = []
+    for n_trucks in preset["api_trucks"]:
+        cases += _api_cases_for(db, client, n_trucks)
+    return cases
+
+
+# ── Run / compare ────────────────────────────────────────────────────
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL, text=True,
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(preset_name: str = "quick", only: Optional[str] = None) -> Dict[str, Any]:
+    """Run every case (optionally filtered by name prefix) and return the report."""
+    preset = PRESETS[preset_name]
+    repeats = preset["repeats"]
+    results: Dict[str, Any] = {}
+    skipped: List[str] = []
+
+    cases = engine_cases(preset)
+    url = os.environ.get("BENCH_DATABASE_URL")
+    if url:
+        cases += api_cases(preset, url)
+    else:
+        skipped.append("api/* (BENCH_DATABASE_URL not set)")
+
+    for name, items, build in cases:
+        if only and not name.startswith(only):
+            continue
+        # Very large cases get fewer repeats so the full preset stays tractable
+        reps = max(3, repeats // 3) if items >= 1_000_000 else repeats
+        results[name] = measure(build(), items, reps)
+        lat = results[name]["latency_ms"]
+        print(f"{name:<60} p50 {lat['p50']:>10.2f} ms  p95 {lat['p95']:>10.2f} ms  "
+              f"peak {results[name]['peak_memory_bytes'] / 2**20:>8.1f} MiB", file=sys.stderr)
+
+    return {
+        "meta": {
+            "preset": preset_name,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "skipped": skipped,
+        },
+        "results": results,
+    }
+
+
+def compare(
+    baseline: Dict[str, Any],
+    current: Dict[str, Any],
+    threshold: float = 0.10,
+) -> List[Dict[str, Any]]:
+    """Cases whose p50 latency or peak memory grew by more than threshold."""
+    regressions = []
+    for name, cur in current["results"].items():
+        base = baseline["results"].get(name)
+        if base is None:
+            continue
+        for metric, b, c in (
+            ("latency_p50_ms", base["latency_ms"]["p50"], cur["latency_ms"]["p50"]),
+            ("peak_memory_bytes", base["peak_memory_bytes"], cur["peak_memory_bytes"]),
+        ):
+            if b > 0 and (c - b) / b > threshold:
+                regressions.append({
+                    "case": name,
+                    "metric": metric,
+                    "baseline": b,
+                    "current": c,
+                    "change": round((c - b) / b, 4),
+                })
+    return regressions
+
+
+# ── CLI ──────────────────────────────────────────────────────────────
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_run = sub.add_parser("run", help="run the suite and write a JSON report")
+    p_run.add_argument("--preset", choices=sorted(PRESETS), default="quick")
+    p_run.add_argument("--only", help="only run cases whose name starts with this prefix")
+    p_run.add_argument("--out", help="write the report here (default: stdout)")
+
+    p_cmp = sub.add_parser("compare", help="flag regressions against a baseline report")
+    p_cmp.add_argument("baseline")
+    p_cmp.add_argument("current")
+    p_cmp.add_argument("--threshold", type=float, default=0.10,
+                       help="relative increase that counts as a regression (default 0.10)")
+
+    args = parser.parse_args()
+
+    if args.command == "run":
+        report = run(args.preset, args.only)
+        if args.out:
+            with open(args.out, "w") as f:
+                json.dump(report, f, indent=2)
+        else:
+            json.dump(report, sys.stdout, indent=2)
+            sys.stdout.write("\n")
+    else:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        with open(args.current) as f:
+            current = json.load(f)
+        regressions = compare(baseline, current, args.threshold)
+        json.dump({"threshold": args.threshold, "regressions": regressions}, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,319 @@
+"""
+Bulk writer for engine decisions into decision_data (Prisma DecisionData).
+
+Streams evaluate_scenario results into a temp staging table with
+COPY ... FROM STDIN, then merges each batch into decision_data with one
+set-based upsert keyed on (truck_id, timestamp). decision_data only has a
+non-unique index on that pair, so the upsert is UPDATE ... FROM staging
+followed by INSERT ... WHERE NOT EXISTS instead of ON CONFLICT. Each merge
+first takes a transaction-scoped advisory lock, so concurrent writers (or
+a retry overlapping a slow run) merge one at a time and cannot both
+insert the same pair.
+
+Every row needs a real timestamp: it is half of the upsert key, so
+re-writing the same batch with the same timestamp updates instead of
+duplicating. Pass one explicitly, or --t-is-epoch when result["t"] holds
+epoch seconds (rolling evaluator run on real time series).
+
+mc_samples is taken from result["mc_samples"], which the engines record;
+--n is only used for older results that lack it.
+
+Usage (engine JSON on stdin, throughput report on stderr):
+    python old/cost_engine.py < input.json \
+        | python decision_writer.py --timestamp 2025-01-01T12:00:00+00:00
+"""
+
+import argparse
+import csv
+import io
+import json
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, Optional
+
+STAGING_TABLE = "decision_data_staging"
+
+COLUMNS = (
+    "truck_id",
+    "timestamp",
+    "recommended_action",
+    "mean_cost",
+    "all_actions",
+    "reason",
+    "route",
+    "mc_samples",
+)
+
+CREATE_STAGING_SQL = f"""
+CREATE TEMP TABLE IF NOT EXISTS {STAGING_TABLE} (
+    seq                BIGSERIAL,
+    truck_id           INTEGER NOT NULL,
+    "timestamp"        TIMESTAMP(3) NOT NULL,
+    recommended_action TEXT NOT NULL,
+    mean_cost          DOUBLE PRECISION NOT NULL,
+    all_actions        JSONB NOT NULL,
+    reason             TEXT NOT NULL,
+    route              JSONB NOT NULL,
+    mc_samples         INTEGER NOT NULL
+)
+"""
+
+_QUOTED = ", ".join(f'"{c}"' for c in COLUMNS)
+
+COPY_SQL = f"COPY {STAGING_TABLE} ({_QUOTED}) FROM STDIN WITH (FORMAT csv)"
+
+# Serializes merges across connections until commit/rollback; without a
+# unique constraint, two overlapping INSERT ... WHERE NOT EXISTS would both
+# see the pair as missing.
+LOCK_SQL = "SELECT pg_advisory_xact_lock(hashtext('decision_data'))"
+
+# Last row wins when the same (truck_id, timestamp) appears twice in a batch.
+MERGE_SQL = f"""
+WITH latest AS (
+    SELECT DISTINCT ON (truck_id, "timestamp") {_QUOTED}
+    FROM {STAGING_TABLE}
+    ORDER BY truck_id, "timestamp", seq DESC
+), updated AS (
+    UPDATE decision_data d
+    SET recommended_action = l.recommended_action,
+        mean_cost          = l.mean_cost,
+        all_actions        = l.all_actions,
+        reason             = l.reason,
+        route              = l.route,
+        mc_samples         = l.mc_samples
+    FROM latest l
+    WHERE d.truck_id = l.truck_id AND d."timestamp" = l."timestamp"
+    RETURNING d.truck_id, d."timestamp"
+)
+INSERT INTO decision_data ({_QUOTED})
+SELECT {", ".join(f'l."{c}"' for c in COLUMNS)}
+FROM latest l
+WHERE NOT EXISTS (
+    SELECT 1 FROM updated u
+    WHERE u.truck_id = l.truck_id AND u."timestamp" = l."timestamp"
+)
+"""
+
+
+def _to_timestamp(val: Any) -> datetime:
+    """Accept datetime, ISO string or epoch seconds; return naive UTC."""
+    if isinstance(val, datetime):
+        ts = val
+    elif isinstance(val, str):
+        ts = datetime.fromisoformat(val)
+    elif isinstance(val, (int, float)):
+        ts = datetime.fromtimestamp(val, tz=timezone.utc)
+    else:
+        raise ValueError(f"Cannot convert {val!r} to a timestamp")
+    if ts.tzinfo is not None:
+        ts = ts.astimezone(timezone.utc).replace(tzinfo=None)
+    return ts
+
+
+def decision_row(
+    result: Dict[str, Any],
+    timestamp: Any = None,
+    mc_samples: Optional[int] = None,
+    route: Optional[Dict[str, Any]] = None,
+    t_is_epoch: bool = False,
+) -> tuple:
+    """Map one engine result to a decision_data row (COLUMNS order).
+
+    timestamp is required unless t_is_epoch is set, in which case
+    result["t"] is read as epoch seconds. Relative ticks are never used.
+    mc_samples comes from result["mc_samples"] when the engine recorded it,
+    otherwise from the argument; one of the two is required.
+    """
+    mc_samples = result.get("mc_samples", mc_samples)
+    if mc_samples is None:
+        raise ValueError(
+            f"No mc_samples for truck {result.get('truck_id')}: result has none, pass mc_samples="
+        )
+    if timestamp is None:
+        if not t_is_epoch or result.get("t") is None:
+            raise ValueError(
+                f"No timestamp for truck {result.get('truck_id')}: pass timestamp= "
+                "or t_is_epoch=True with epoch-second result['t']"
+            )
+        timestamp = result["t"]
+    chosen = result["recommended_action"]
+    all_actions = [
+        {
+            "action": name,
+            "mean_cost": a["stats"]["mean"],
+            "score": a["score"],
+            "mean_cost_components": {
+                k: v for k, v in a["breakdown_means"].items() if k != "fixed_cost"
+            },
+        }
+        for name, a in result["per_action"].items()
+    ]
+    if route is None:
+        route = {"current_node": result.get("node_id")}
+    return (
+        int(result["truck_id"]),
+        _to_timestamp(timestamp).isoformat(sep=" "),
+        chosen,
+        float(result["per_action"][chosen]["stats"]["mean"]),
+        json.dumps(all_actions),
+        result.get("rationale", ""),
+        json.dumps(route),
+        int(mc_samples),
+    )
+
+
+class DecisionWriter:
+    """Batched COPY + upsert writer with transactional checkpoints.
+
+    Rows are buffered until batch_size, then copied and merged. The
+    transaction is committed every checkpoint_every batches; on error the
+    open transaction is rolled back so decision_data only ever holds whole
+    checkpoints (see stats["rows_committed"]).
+    """
+
+    def __init__(self, conn, batch_size: int = 5_000, checkpoint_every: int = 1):
+        if batch_size < 1 or checkpoint_every < 1:
+            raise ValueError("batch_size and checkpoint_every must be >= 1")
+        self.conn = conn
+        self.batch_size = batch_size
+        self.checkpoint_every = checkpoint_every
+        self._buffer = io.StringIO()
+        # Quote strings so an empty reason is "" rather than NULL under COPY csv
+        self._writer = csv.writer(self._buffer, quoting=csv.QUOTE_NONNUMERIC)
+        self._buffered = 0
+        self._batches_since_checkpoint = 0
+        self._rows_since_checkpoint = 0
+        self._started = time.perf_counter()
+        self._staging_ready = False
+        self.stats = {
+            "rows_written": 0,
+            "rows_committed": 0,
+            "batches": 0,
+            "checkpoints": 0,
+            "seconds": 0.0,
+            "rows_per_sec": 0.0,
+        }
+
+    def add_row(self, row: tuple) -> None:
+        """Buffer one decision_data row (COLUMNS order)."""
+        self._writer.writerow(row)
+        self._buffered += 1
+        if self._buffered >= self.batch_size:
+            self._flush_batch()
+
+    def add(self, result: Dict[str, Any], **kwargs) -> None:
+        """Buffer one engine result; kwargs are passed to decision_row."""
+        self.add_row(decision_row(result, **kwargs))
+
+    def write(self, results: Iterable[Dict[str, Any]], **kwargs) -> Dict[str, Any]:
+        """Write all results, commit, and return the throughput report."""
+        for result in results:
+            self.add(result, **kwargs)
+        return self.close()
+
+    def _flush_batch(self) -> None:
+        if not self._buffered:
+            return
+        try:
+            with self.conn.cursor() as cur:
+                if not self._staging_ready:
+                    cur.execute(CREATE_STAGING_SQL)
+                    self._staging_ready = True
+                self._buffer.seek(0)
+                cur.copy_expert(COPY_SQL, self._buffer)
+                cur.execute(LOCK_SQL)
+                cur.execute(MERGE_SQL)
+                cur.execute(f"TRUNCATE {STAGING_TABLE}")
+        except Exception:
+            self._rollback()
+            raise
+
+        self.stats["rows_written"] += self._buffered
+        self.stats["batches"] += 1
+        self._rows_since_checkpoint += self._buffered
+        self._batches_since_checkpoint += 1
+        self._reset_buffer()
+        if self._batches_since_checkpoint >= self.checkpoint_every:
+            self.checkpoint()
+
+    def checkpoint(self) -> None:
+        """Commit everything merged so far."""
+        self.conn.commit()
+        self.stats["rows_committed"] += self._rows_since_checkpoint
+        self.stats["checkpoints"] += 1
+        self._rows_since_checkpoint = 0
+        self._batches_since_checkpoint = 0
+
+    def _rollback(self) -> None:
+        self.conn.rollback()
+        # The temp table is dropped with the transaction if it was created in it
+        self._staging_ready = False
+        self.stats["rows_written"] -= self._rows_since_checkpoint
+        self._rows_since_checkpoint = 0
+        self._batches_since_checkpoint = 0
+        self._reset_buffer()
+
+    def _reset_buffer(self) -> None:
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        self._buffered = 0
+
+    def flush(self) -> None:
+        """Copy and merge any buffered rows, then commit."""
+        self._flush_batch()
+        if self._batches_since_checkpoint:
+            self.checkpoint()
+
+    def close(self) -> Dict[str, Any]:
+        """Flush and return the throughput report."""
+        self.flush()
+        elapsed = time.perf_counter() - self._started
+        self.stats["seconds"] = round(elapsed, 4)
+        self.stats["rows_per_sec"] = round(self.stats["rows_committed"] / elapsed, 1) if elapsed else 0.0
+        return self.stats
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self._rollback()
+        return False
+
+
+# ── CLI: engine results JSON on stdin ────────────────────────────────
+
+if __name__ == "__main__":
+    from server import get_db_connection
+
+    parser = argparse.ArgumentParser(description="Bulk-write engine results to decision_data")
+    when = parser.add_mutually_exclusive_group(required=True)
+    when.add_argument("--timestamp", help="ISO timestamp applied to every row")
+    when.add_argument("--t-is-epoch", action="store_true",
+                      help='take each row\'s timestamp from result["t"] (epoch seconds)')
+    parser.add_argument("--batch-size", type=int, default=5_000)
+    parser.add_argument("--checkpoint-every", type=int, default=1)
+    parser.add_argument("--n", type=int,
+                        help='mc_samples for results without result["mc_samples"]')
+    args = parser.parse_args()
+
+    results = json.loads(sys.stdin.read())
+
+    conn = get_db_connection()
+    try:
+        writer = DecisionWriter(
+            conn, batch_size=args.batch_size, checkpoint_every=args.checkpoint_every,
+        )
+        report = writer.write(
+            results,
+            timestamp=args.timestamp,
+            t_is_epoch=args.t_is_epoch,
+            mc_samples=args.n,
+        )
+    finally:
+        conn.close()
+    json.dump(report, sys.stderr)
+    sys.stderr.write("\n")
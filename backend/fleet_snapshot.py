@@ -0,0 +1,533 @@
+"""
+Local columnar snapshot of fleet_decisions_full_6.
+
+Exports the table to one .npy file per column (plus a null mask where
+needed) so the Flask server and offline engine runs can read it with
+np.load(mmap_mode="r") instead of a full network scan.
+
+Layout:
+    <dir>/manifest.json      current version, high-water mark, column kinds
+    <dir>/v<N>/<col>.npy     column values
+    <dir>/v<N>/<col>.offsets.npy  row offsets into <col>.npy (text columns only)
+    <dir>/v<N>/<col>.null.npy  null mask (only for columns with nulls)
+
+Text and JSON columns are stored variable-width: <col>.npy is the UTF-8
+bytes of every value back to back and <col>.offsets.npy the n + 1 byte
+offsets, so size tracks the actual text rather than the longest value.
+
+Refresh is incremental on a high-water mark column (default "ts"): rows
+with ts >= the stored mark are re-fetched and appended, replacing the rows
+at exactly the mark. Updates to older rows are only picked up by a full
+export. Each refresh writes a new version directory and swaps the
+manifest atomically, so readers never see a half-written snapshot.
+
+Offline/engine runs use load_snapshot(dir).columns (name -> mmap array,
+or TextColumn for text) directly; the server uses FleetSnapshot.rows().
+
+Usage:
+    python fleet_snapshot.py export|refresh|info [dir]
+"""
+
+import fcntl
+import json
+import os
+import shutil
+import sys
+import time
+from contextlib import contextmanager
+from datetime import date, datetime, timezone
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from psycopg2 import sql
+
+FLEET_TABLE = "fleet_decisions_full_6"
+DEFAULT_SNAPSHOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".snapshot")
+DEFAULT_WATERMARK_COLUMN = "ts"
+FETCH_SIZE = 10_000
+KEEP_VERSIONS = 2
+# Bumped when the on-disk layout changes; older snapshots are re-exported
+SNAPSHOT_FORMAT = 2
+TEXT_KINDS = ("str", "json")
+
+
+# ── Column encoding ──────────────────────────────────────────────────
+
+class TextColumn:
+    """Variable-width UTF-8 column: one byte buffer plus n + 1 row offsets."""
+
+    __slots__ = ("data", "offsets")
+
+    def __init__(self, data: np.ndarray, offsets: np.ndarray):
+        self.data = data
+        self.offsets = offsets
+
+    @classmethod
+    def from_strings(cls, values: List[str]) -> "TextColumn":
+        encoded = [v.encode("utf-8") for v in values]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(b) for b in encoded], out=offsets[1:])
+        return cls(np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets)
+
+    @staticmethod
+    def concatenate(a: "TextColumn", b: "TextColumn") -> "TextColumn":
+        return TextColumn(
+            np.concatenate([a.data, b.data]),
+            np.concatenate([a.offsets, b.offsets[1:] + a.offsets[-1]]),
+        )
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, keep: np.ndarray) -> "TextColumn":
+        """Rows selected by a boolean mask."""
+        return TextColumn.from_strings(
+            [v for v, k in zip(self.tolist(), keep.tolist()) if k]
+        )
+
+    def tolist(self) -> List[str]:
+        buf = self.data.tobytes()
+        bounds = self.offsets.tolist()
+        return [buf[a:b].decode("utf-8") for a, b in zip(bounds, bounds[1:])]
+
+
+def _concat(a, b):
+    if isinstance(a, TextColumn):
+        return TextColumn.concatenate(a, b)
+    return np.concatenate([a, b])
+
+
+def _infer_kind(values: List[Any]) -> str:
+    """Pick the narrowest column kind that holds every non-null value."""
+    types = {type(v) for v in values if v is not None}
+    if not types:
+        return "null"
+    if types == {bool}:
+        return "bool"
+    if types == {int}:
+        return "int"
+    if types <= {int, float, Decimal}:
+        return "float"
+    if types == {datetime}:
+        aware = {v.tzinfo is not None for v in values if v is not None}
+        if len(aware) > 1:
+            return "str"
+        return "datetime_tz" if aware.pop() else "datetime"
+    if types == {date}:
+        return "date"
+    if types <= {dict, list}:
+        return "json"
+    return "str"
+
+
+def _to_naive_utc(v: datetime) -> datetime:
+    if v.tzinfo is not None:
+        v = v.astimezone(timezone.utc).replace(tzinfo=None)
+    return v
+
+
+def _encode(values: List[Any], kind: str) -> Tuple[Any, Optional[np.ndarray]]:
+    """Encode a column of Python values; raises TypeError if they don't fit kind."""
+    mask = np.fromiter((v is None for v in values), dtype=bool, count=len(values))
+    present = [v for v in values if v is not None]
+
+    def check(ok) -> None:
+        if not all(ok(v) for v in present):
+            raise TypeError(f"values do not fit column kind {kind!r}")
+
+    if kind == "null":
+        check(lambda v: False)
+        arr = np.zeros(len(values), dtype=bool)
+    elif kind == "bool":
+        check(lambda v: isinstance(v, bool))
+        arr = np.array([bool(v) for v in values], dtype=bool)
+    elif kind == "int":
+        check(lambda v: isinstance(v, int) and not isinstance(v, bool))
+        arr = np.array([0 if v is None else v for v in values], dtype=np.int64)
+    elif kind == "float":
+        check(lambda v: isinstance(v, (int, float, Decimal)) and not isinstance(v, bool))
+        arr = np.array([np.nan if v is None else float(v) for v in values], dtype=np.float64)
+    elif kind in ("datetime", "datetime_tz"):
+        check(lambda v: isinstance(v, datetime) and (v.tzinfo is not None) == (kind == "datetime_tz"))
+        arr = np.array(
+            [np.datetime64("NaT") if v is None else np.datetime64(_to_naive_utc(v), "us")
+             for v in values],
+            dtype="datetime64[us]",
+        )
+    elif kind == "date":
+        check(lambda v: isinstance(v, date) and not isinstance(v, datetime))
+        arr = np.array(
+            [np.datetime64("NaT") if v is None else np.datetime64(v, "D") for v in values],
+            dtype="datetime64[D]",
+        )
+    elif kind == "json":
+        check(lambda v: isinstance(v, (dict, list)))
+        arr = TextColumn.from_strings(["" if v is None else json.dumps(v) for v in values])
+    else:
+        check(lambda v: not isinstance(v, (dict, list)))
+        arr = TextColumn.from_strings(["" if v is None else str(v) for v in values])
+    return arr, (mask if mask.any() else None)
+
+
+def _decode(arr: Any, mask: Optional[np.ndarray], kind: str) -> List[Any]:
+    """Column back to JSON-serializable values (same shape as server._serialize)."""
+    if kind == "null":
+        return [None] * len(arr)
+    values = arr.tolist()
+    if kind == "datetime_tz":
+        values = [v.replace(tzinfo=timezone.utc).isoformat() if v is not None else None
+                  for v in values]
+    elif kind in ("datetime", "date"):
+        values = [v.isoformat() if v is not None else None for v in values]
+    elif kind == "json":
+        values = [json.loads(v) if v else None for v in values]
+    if mask is not None:
+        values = [None if m else v for v, m in zip(values, mask.tolist())]
+    return values
+
+
+# ── Manifest / versioned storage ─────────────────────────────────────
+
+def _manifest_path(path: str) -> str:
+    return os.path.join(path, "manifest.json")
+
+
+def read_manifest(path: str = DEFAULT_SNAPSHOT_DIR) -> Optional[Dict[str, Any]]:
+    """Current manifest, or None if no snapshot (in the current format) exists."""
+    try:
+        with open(_manifest_path(path)) as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return None
+    if manifest.get("format") != SNAPSHOT_FORMAT:
+        return None
+    return manifest
+
+
+def _write_manifest(path: str, manifest: Dict[str, Any]) -> None:
+    tmp = _manifest_path(path) + f".tmp{os.getpid()}"
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp, _manifest_path(path))
+
+
+def _touch_manifest(path: str, manifest: Dict[str, Any]) -> Dict[str, Any]:
+    """Mark the current version fresh without rewriting any column files."""
+    manifest = dict(
+        manifest,
+        refreshed_at=datetime.now(timezone.utc).isoformat(),
+        refreshed_at_epoch=time.time(),
+    )
+    _write_manifest(path, manifest)
+    return manifest
+
+
+def snapshot_age(manifest: Dict[str, Any]) -> float:
+    """Seconds since the manifest was last refreshed."""
+    return time.time() - manifest["refreshed_at_epoch"]
+
+
+def _write_version(
+    path: str,
+    columns: Dict[str, Any],
+    masks: Dict[str, Optional[np.ndarray]],
+    kinds: Dict[str, str],
+    order: List[str],
+    watermark_column: str,
+    previous: Optional[Dict[str, Any]],
+    full: bool,
+) -> Dict[str, Any]:
+    """Write a new version directory and atomically point the manifest at it."""
+    # Number past any existing directory too (e.g. one left by an older format),
+    # so a version directory that readers may have mapped is never rewritten
+    existing = [int(e[1:]) for e in os.listdir(path) if e.startswith("v") and e[1:].isdigit()]
+    version = max([previous["version"] if previous else 0, *existing]) + 1
+    vdir = os.path.join(path, f"v{version}")
+    os.makedirs(vdir, exist_ok=True)
+
+    for i, name in enumerate(order):
+        col = columns[name]
+        if isinstance(col, TextColumn):
+            np.save(os.path.join(vdir, f"{i}.npy"), col.data)
+            np.save(os.path.join(vdir, f"{i}.offsets.npy"), col.offsets)
+        else:
+            np.save(os.path.join(vdir, f"{i}.npy"), col)
+        if masks[name] is not None:
+            np.save(os.path.join(vdir, f"{i}.null.npy"), masks[name])
+
+    row_count = len(columns[order[0]]) if order else 0
+    hwm = None
+    # Text marks aren't supported; without one every refresh is a full export
+    if watermark_column in columns and row_count and kinds[watermark_column] not in TEXT_KINDS:
+        wm = columns[watermark_column]
+        valid = wm[~masks[watermark_column]] if masks[watermark_column] is not None else wm
+        if len(valid):
+            hwm = _decode(np.array([valid.max()]), None, kinds[watermark_column])[0]
+
+    now = datetime.now(timezone.utc).isoformat()
+    manifest = {
+        "format": SNAPSHOT_FORMAT,
+        "table": FLEET_TABLE,
+        "version": version,
+        "row_count": row_count,
+        "columns": [
+            {"name": name, "file": f"{i}.npy", "kind": kinds[name], "nullable": masks[name] is not None}
+            for i, name in enumerate(order)
+        ],
+        "watermark_column": watermark_column,
+        "high_water_mark": hwm,
+        "exported_at": now if full or not previous else previous["exported_at"],
+        "refreshed_at": now,
+        "refreshed_at_epoch": time.time(),
+    }
+    _write_manifest(path, manifest)
+
+    # Readers holding an older mmap keep working after unlink (POSIX)
+    for entry in os.listdir(path):
+        if entry.startswith("v") and entry[1:].isdigit() and int(entry[1:]) <= version - KEEP_VERSIONS:
+            shutil.rmtree(os.path.join(path, entry), ignore_errors=True)
+    return manifest
+
+
+@contextmanager
+def _writer_lock(path: str, blocking: bool = True):
+    """Serialise exports/refreshes across processes (e.g. gunicorn workers).
+
+    Yields whether the lock was taken; only False when blocking=False and
+    another process holds it.
+    """
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, ".lock"), "w") as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+# ── Fetch from Postgres ──────────────────────────────────────────────
+
+def _fetch_columns(conn, watermark_column: str, since: Any = None) -> Tuple[List[str], Dict[str, List[Any]]]:
+    """Stream rows (optionally ts >= since) into per-column Python lists."""
+    query = sql.SQL("SELECT * FROM {}").format(sql.Identifier(FLEET_TABLE))
+    params: Tuple = ()
+    if since is not None:
+        query = sql.SQL("{} WHERE {} >= %s").format(query, sql.Identifier(watermark_column))
+        params = (since,)
+
+    order: List[str] = []
+    data: Dict[str, List[Any]] = {}
+    with conn.cursor(name="fleet_snapshot") as cur:
+        cur.itersize = FETCH_SIZE
+        cur.execute(query, params)
+        while True:
+            batch = cur.fetchmany(FETCH_SIZE)
+            if not order and cur.description:
+                order = [d[0] for d in cur.description]
+                data = {name: [] for name in order}
+            if not batch:
+                break
+            for row in batch:
+                values = row.values() if isinstance(row, dict) else row
+                for name, v in zip(order, values):
+                    data[name].append(v)
+    return order, data
+
+
+def export_snapshot(
+    conn,
+    path: str = DEFAULT_SNAPSHOT_DIR,
+    watermark_column: str = DEFAULT_WATERMARK_COLUMN,
+) -> Dict[str, Any]:
+    """Full export of the fleet table; returns the new manifest."""
+    with _writer_lock(path):
+        return _export(conn, path, watermark_column)
+
+
+def _export(conn, path: str, watermark_column: str) -> Dict[str, Any]:
+    order, data = _fetch_columns(conn, watermark_column)
+    kinds = {name: _infer_kind(data[name]) for name in order}
+    columns, masks = {}, {}
+    for name in order:
+        columns[name], masks[name] = _encode(data[name], kinds[name])
+    return _write_version(
+        path, columns, masks, kinds, order, watermark_column, read_manifest(path), full=True,
+    )
+
+
+def refresh_snapshot(
+    conn,
+    path: str = DEFAULT_SNAPSHOT_DIR,
+    max_age: Optional[float] = None,
+    wait: bool = True,
+) -> Optional[Dict[str, Any]]:
+    """Append rows at or past the high-water mark; full export if that isn't possible.
+
+    With max_age, a snapshot another process refreshed while we waited for
+    the lock is returned as-is. With wait=False, if another process is
+    already refreshing, the current manifest (possibly None) is returned
+    without waiting.
+    """
+    with _writer_lock(path, blocking=wait) as locked:
+        manifest = read_manifest(path)
+        if not locked:
+            return manifest
+        if max_age is not None and manifest is not None and snapshot_age(manifest) <= max_age:
+            return manifest
+        return _refresh(conn, path)
+
+
+def _refresh(conn, path: str) -> Dict[str, Any]:
+    manifest = read_manifest(path)
+    if manifest is None or manifest["high_water_mark"] is None:
+        return _export(conn, path, DEFAULT_WATERMARK_COLUMN)
+
+    wm_col = manifest["watermark_column"]
+    wm_kind = next(c["kind"] for c in manifest["columns"] if c["name"] == wm_col)
+    since = manifest["high_water_mark"]
+    if wm_kind in ("datetime", "datetime_tz"):
+        since = datetime.fromisoformat(since)
+
+    order, data = _fetch_columns(conn, wm_col, since)
+    snap = FleetSnapshot(path, manifest)
+    if order != snap.column_names:
+        return _export(conn, path, wm_col)
+
+    # Rows exactly at the old mark are re-fetched, so drop them from the old version
+    wm_old = snap.columns[wm_col]
+    hwm_np = wm_old[~snap.masks[wm_col]].max() if snap.masks[wm_col] is not None else wm_old.max()
+    keep = wm_old != hwm_np
+    if snap.masks[wm_col] is not None:
+        keep |= snap.masks[wm_col]
+
+    columns, masks, fetched = {}, {}, {}
+    try:
+        for name in order:
+            kind = snap.kinds[name]
+            new_arr, new_mask = _encode(data[name], kind)
+            fetched[name] = (new_arr, new_mask)
+            old_arr, old_mask = snap.columns[name][keep], snap.masks[name]
+            old_mask = old_mask[keep] if old_mask is not None else np.zeros(len(old_arr), dtype=bool)
+            columns[name] = _concat(old_arr, new_arr)
+            mask = np.concatenate([
+                old_mask, new_mask if new_mask is not None else np.zeros(len(new_arr), dtype=bool),
+            ])
+            masks[name] = mask if mask.any() else None
+    except TypeError:
+        # New values don't fit the stored column kinds (e.g. a column went from all-null)
+        return _export(conn, path, wm_col)
+
+    if _same_rows(snap, ~keep, fetched):
+        return _touch_manifest(path, manifest)
+    return _write_version(path, columns, masks, snap.kinds, order, wm_col, manifest, full=False)
+
+
+def _same_rows(
+    snap: "FleetSnapshot",
+    at_mark: np.ndarray,
+    fetched: Dict[str, Tuple[np.ndarray, Optional[np.ndarray]]],
+) -> bool:
+    """True if the refetched rows are exactly the stored rows at the mark (any order)."""
+    names = snap.column_names
+    if not names or len(fetched[names[0]][0]) != int(at_mark.sum()):
+        return False
+
+    def rows(cols) -> List[str]:
+        return sorted(repr(r) for r in zip(*cols))
+
+    old = [
+        _decode(snap.columns[n][at_mark],
+                snap.masks[n][at_mark] if snap.masks[n] is not None else None, snap.kinds[n])
+        for n in names
+    ]
+    new = [_decode(*fetched[n], snap.kinds[n]) for n in names]
+    return rows(old) == rows(new)
+
+
+# ── Reader ───────────────────────────────────────────────────────────
+
+class FleetSnapshot:
+    """Memory-mapped, read-only view of one snapshot version."""
+
+    def __init__(self, path: str = DEFAULT_SNAPSHOT_DIR, manifest: Optional[Dict[str, Any]] = None):
+        manifest = manifest or read_manifest(path)
+        if manifest is None:
+            raise FileNotFoundError(f"No fleet snapshot in {path}")
+        self.path = path
+        self.manifest = manifest
+        vdir = os.path.join(path, f"v{manifest['version']}")
+
+        self.column_names: List[str] = []
+        self.kinds: Dict[str, str] = {}
+        self.columns: Dict[str, Any] = {}
+        self.masks: Dict[str, Optional[np.ndarray]] = {}
+        for col in manifest["columns"]:
+            name = col["name"]
+            file = os.path.join(vdir, col["file"])
+            self.column_names.append(name)
+            self.kinds[name] = col["kind"]
+            self.columns[name] = np.load(file, mmap_mode="r")
+            if col["kind"] in TEXT_KINDS:
+                offsets = np.load(file[:-len(".npy")] + ".offsets.npy", mmap_mode="r")
+                self.columns[name] = TextColumn(self.columns[name], offsets)
+            self.masks[name] = (
+                np.load(file[:-len(".npy")] + ".null.npy", mmap_mode="r") if col["nullable"] else None
+            )
+
+    @property
+    def version(self) -> int:
+        return self.manifest["version"]
+
+    @property
+    def age_seconds(self) -> float:
+        return snapshot_age(self.manifest)
+
+    def __len__(self) -> int:
+        return self.manifest["row_count"]
+
+    def rows(self) -> List[Dict[str, Any]]:
+        """All rows as JSON-serializable dicts, same shape as server.fetch_fleet_table."""
+        decoded = [
+            _decode(self.columns[n], self.masks[n], self.kinds[n]) for n in self.column_names
+        ]
+        names = self.column_names
+        return [dict(zip(names, vals)) for vals in zip(*decoded)]
+
+
+def load_snapshot(path: str = DEFAULT_SNAPSHOT_DIR) -> FleetSnapshot:
+    """Open the current snapshot version (memory-mapped, zero-copy)."""
+    return FleetSnapshot(path)
+
+
+# ── CLI ──────────────────────────────────────────────────────────────
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "info"
+    path = sys.argv[2] if len(sys.argv) > 2 else os.environ.get("FLEET_SNAPSHOT_DIR", DEFAULT_SNAPSHOT_DIR)
+
+    if command == "info":
+        json.dump(read_manifest(path), sys.stdout, indent=2)
+    elif command in ("export", "refresh"):
+        from server import get_db_connection
+
+        conn = get_db_connection()
+        try:
+            started = time.perf_counter()
+            fn = export_snapshot if command == "export" else refresh_snapshot
+            manifest = fn(conn, path)
+        finally:
+            conn.close()
+        json.dump({
+            "version": manifest["version"],
+            "row_count": manifest["row_count"],
+            "high_water_mark": manifest["high_water_mark"],
+            "seconds": round(time.perf_counter() - started, 3),
+        }, sys.stdout)
+    else:
+        sys.exit(f"Unknown command {command!r}; use export, refresh or info")
+    sys.stdout.write("\n")
@@ -0,0 +1,328 @@
+"""
+Low-overhead instrumentation for the fleet API and the engines.
+
+Per-stage timers and counters kept in an in-process registry and rendered
+in Prometheus text format for /metrics. Each gunicorn worker keeps its own
+registry, so scrape per worker or run a single worker when that matters.
+
+The engines in old/ record into the registry of whichever process runs
+them; the API server does not, so their timers never appear in its
+/metrics. benchmark.py reports them per case, and the engine CLIs dump
+the registry at exit when METRICS_DUMP is set.
+
+Controlled by environment variables (read at import):
+    METRICS_ENABLED=false      turn everything into no-ops (default true);
+                               decorated functions are left unwrapped
+    METRICS_SERVER_TIMING=true add a Server-Timing header to every response
+    PROFILING_ENABLED=true     allow ?profile=cpu|mem per request
+    PROFILE_DIR=/path          where profile dumps go (default: temp dir)
+    METRICS_DUMP=stderr|/path  engine CLIs write the registry here at exit
+"""
+
+import atexit
+import bisect
+import contextlib
+import cProfile
+import functools
+import math
+import os
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+def _env_flag(name: str, default: str = "false") -> bool:
+    return os.environ.get(name, default).lower() == "true"
+
+
+ENABLED = _env_flag("METRICS_ENABLED", "true")
+SERVER_TIMING = _env_flag("METRICS_SERVER_TIMING")
+PROFILING_ENABLED = _env_flag("PROFILING_ENABLED")
+PROFILE_DIR = os.environ.get("PROFILE_DIR", tempfile.gettempdir())
+
+DEFAULT_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0,
+)
+
+STAGE_METRIC = "fleet_stage_duration_seconds"
+
+METRIC_HELP = {
+    STAGE_METRIC: ("histogram", "Time spent per hot-path stage"),
+    "fleet_request_duration_seconds": ("histogram", "HTTP request latency by endpoint"),
+    "fleet_requests_total": ("counter", "HTTP requests by endpoint and status"),
+    "fleet_rows_total": ("counter", "Fleet rows loaded, by source"),
+    "fleet_response_bytes_total": ("counter", "Response body bytes by endpoint"),
+    "fleet_snapshot_refresh_errors_total": ("counter", "Failed snapshot refreshes served stale"),
+    "engine_mc_samples_total": ("counter", "Monte Carlo samples simulated"),
+}
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+# ── Registry ─────────────────────────────────────────────────────────
+
+class _Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        i = bisect.bisect_left(self.buckets, value)
+        if i < len(self.counts):
+            self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+
+def _format_value(value: float) -> str:
+    """Exact sample value: ints as-is, floats round-trip (not %g's 6 digits)."""
+    if isinstance(value, int):
+        return str(value)
+    if math.isnan(value):
+        return "NaN"
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+def _format_labels(labels: Labels, extra: str = "") -> str:
+    parts = [f'{k}="{v}"' for k, v in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Registry:
+    """Counters and histograms keyed by (name, labels)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[Labels, float]] = {}
+        self._histograms: Dict[str, Dict[Labels, _Histogram]] = {}
+
+    def inc(self, name: str, value: float = 1, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            hist = series.get(key)
+            if hist is None:
+                hist = series[key] = _Histogram(DEFAULT_BUCKETS)
+            hist.observe(value)
+
+    def histogram_summary(self, name: str, label: str) -> Dict[str, Tuple[int, float]]:
+        """(count, sum) of one histogram per value of label, e.g. per stage."""
+        out: Dict[str, Tuple[int, float]] = {}
+        with self._lock:
+            for labels, hist in self._histograms.get(name, {}).items():
+                key = dict(labels).get(label, "")
+                n, total = out.get(key, (0, 0.0))
+                out[key] = (n + hist.count, total + hist.sum)
+        return out
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)."""
+        lines: List[str] = []
+
+        def header(name: str, kind: str) -> None:
+            help_text = METRIC_HELP.get(name, (kind, name))[1]
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        with self._lock:
+            for name in sorted(self._counters):
+                header(name, "counter")
+                for labels, value in sorted(self._counters[name].items()):
+                    lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+            for name in sorted(self._histograms):
+                header(name, "histogram")
+                for labels, hist in sorted(self._histograms[name].items()):
+                    cumulative = 0
+                    for bound, n in zip(hist.buckets, hist.counts):
+                        cumulative += n
+                        le = _format_labels(labels, f'le="{bound:g}"')
+                        lines.append(f"{name}_bucket{le} {cumulative}")
+                    inf = _format_labels(labels, 'le="+Inf"')
+                    lines.append(f"{name}_bucket{inf} {hist.count}")
+                    lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(hist.sum)}")
+                    lines.append(f"{name}_count{_format_labels(labels)} {hist.count}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+# ── Stage timers / counters ──────────────────────────────────────────
+
+_local = threading.local()
+
+
+class _Stage:
+    __slots__ = ("name", "started")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.started
+        REGISTRY.observe(STAGE_METRIC, elapsed, stage=self.name)
+        timings = getattr(_local, "timings", None)
+        if timings is not None:
+            timings.append((self.name, elapsed))
+        return False
+
+
+_NOOP = contextlib.nullcontext()
+
+
+def stage(name: str):
+    """Context manager timing one hot-path stage (no-op when disabled)."""
+    return _Stage(name) if ENABLED else _NOOP
+
+
+def timed(name: str) -> Callable[[Callable], Callable]:
+    """Decorator form of stage(); returns the function unwrapped when disabled."""
+    def decorate(fn: Callable) -> Callable:
+        if not ENABLED:
+            return fn
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with _Stage(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def count(name: str, value: float = 1, **labels: str) -> None:
+    """Increment a counter (no-op when disabled)."""
+    if ENABLED:
+        REGISTRY.inc(name, value, **labels)
+
+
+def observe(name: str, value: float, **labels: str) -> None:
+    """Record a histogram observation (no-op when disabled)."""
+    if ENABLED:
+        REGISTRY.observe(name, value, **labels)
+
+
+# ── Per-request Server-Timing ────────────────────────────────────────
+
+def start_request_timings() -> None:
+    """Collect stage timings for the current thread's request."""
+    _local.timings = []
+
+
+def pop_request_timings() -> List[Tuple[str, float]]:
+    timings = getattr(_local, "timings", None) or []
+    _local.timings = None
+    return timings
+
+
+def server_timing_header(timings: List[Tuple[str, float]]) -> str:
+    """Server-Timing value with durations (ms) summed per stage, in first-seen order."""
+    totals: Dict[str, float] = {}
+    for name, elapsed in timings:
+        totals[name] = totals.get(name, 0.0) + elapsed
+    return ", ".join(f"{name};dur={elapsed * 1e3:.2f}" for name, elapsed in totals.items())
+
+
+# ── Dump at exit (engine CLIs) ───────────────────────────────────────
+
+def dump_registry(target: str) -> None:
+    """Write REGISTRY.render() to stderr or to the file at target."""
+    text = REGISTRY.render()
+    if target == "stderr":
+        sys.stderr.write(text)
+    else:
+        with open(target, "w") as f:
+            f.write(text)
+
+
+def dump_at_exit() -> None:
+    """Dump the registry at interpreter exit if METRICS_DUMP is set."""
+    target = os.environ.get("METRICS_DUMP")
+    if target and ENABLED:
+        atexit.register(dump_registry, target)
+
+
+# ── Opt-in per-request profiler ──────────────────────────────────────
+
+# cProfile and tracemalloc are process-wide: one profiled request at a time
+_profile_lock = threading.Lock()
+
+
+class RequestProfiler:
+    """cProfile ("cpu") or tracemalloc ("mem") dump for a single request."""
+
+    def __init__(self, mode: str, label: str = "request"):
+        if mode not in ("cpu", "mem"):
+            raise ValueError(f"Unknown profile mode {mode!r}; use cpu or mem")
+        self.mode = mode
+        self.label = label
+        self._profile: Optional[cProfile.Profile] = None
+        self._owns_tracemalloc = False
+
+    def start(self) -> Optional["RequestProfiler"]:
+        """Start profiling; None if another request is already being profiled."""
+        if not _profile_lock.acquire(blocking=False):
+            return None
+        try:
+            if self.mode == "cpu":
+                self._profile = cProfile.Profile()
+                self._profile.enable()
+            elif not tracemalloc.is_tracing():
+                tracemalloc.start(25)
+                self._owns_tracemalloc = True
+        except BaseException:
+            _profile_lock.release()
+            raise
+        return self
+
+    def stop(self) -> str:
+        """Stop profiling and write the dump; returns its path."""
+        try:
+            return self._dump()
+        finally:
+            _profile_lock.release()
+
+    def _dump(self) -> str:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        base = os.path.join(PROFILE_DIR, f"{self.label}-{int(time.time() * 1e3)}-{os.getpid()}")
+        if self.mode == "cpu":
+            self._profile.disable()
+            path = base + ".prof"
+            self._profile.dump_stats(path)
+            return path
+
+        snapshot = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        if self._owns_tracemalloc:
+            tracemalloc.stop()
+        path = base + ".tracemalloc.txt"
+        with open(path, "w") as f:
+            f.write(f"peak_bytes {peak}\n")
+            for stat in snapshot.statistics("lineno")[:50]:
+                f.write(f"{stat}\n")
+        return path
@@ -19,7 +19,9 @@ import json
 import sys
 import numpy as np
 from dataclasses import dataclass
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
+
+from engine_metrics import count, dump_at_exit, timed
 
 
 # ── Action definitions ───────────────────────────────────────────────
@@ -48,6 +50,7 @@ class ScenarioRow:
     spoilage_time_base_hours: float
     shipment_value: Optional[float] = None
     recommended_action: Optional[str] = None
+    t: Optional[float] = None  # tick / epoch seconds when streamed as a trip
 
 
 # ── Business logic ───────────────────────────────────────────────────
@@ -78,6 +81,57 @@ def extra_violation_minutes(action_name: str, extra_time: float, row: ScenarioRo
 
 # ── Monte Carlo simulation ───────────────────────────────────────────
 
+def operating_travel_cost(
+    distance: float,
+    mile_cost: np.ndarray,
+    mph: np.ndarray,
+    handling_fee: np.ndarray,
+) -> np.ndarray:
+    """Operating & travel cost from pre-drawn per-mile and handling samples."""
+    rate_per_mile = (mile_cost * mph) / 60.0
+    travel_cost = rate_per_mile * distance
+    return travel_cost + handling_fee
+
+
+def delay_service_cost(
+    delay_minutes: float,
+    shipment_vals: np.ndarray,
+    detention_rate: np.ndarray,
+) -> np.ndarray:
+    """OTIF penalty plus detention cost from pre-drawn samples."""
+    otif_cost = 0.03 * shipment_vals
+    detention_cost = detention_rate * max(delay_minutes, 0)
+    return otif_cost + detention_cost
+
+
+def spoilage_cost(
+    spoilage_time_hours: float,
+    door_open: bool,
+    humidity: bool,
+    shipment_vals: np.ndarray,
+    lambda_1_jitter: np.ndarray,
+    lambda_6_jitter: np.ndarray,
+) -> np.ndarray:
+    """Spoilage cost (exponential P(loss), knee at 4 h) from pre-drawn samples."""
+    lambda_1_base = -np.log(1 - 0.2) / 1.0
+    lambda_6_base = -np.log(1 - 0.8) / 6.0
+    lambda_1 = lambda_1_base * lambda_1_jitter
+    lambda_6 = lambda_6_base * lambda_6_jitter
+
+    t = max(spoilage_time_hours, 0)
+    if t <= 4:
+        p_loss = 1 - np.exp(-lambda_1 * t)
+    else:
+        frac = np.clip((t - 4) / 2.0, 0, 1)
+        lambda_t = lambda_1 + frac * (lambda_6 - lambda_1)
+        p_loss = 1 - np.exp(-lambda_t * t)
+
+    door_mult = 1.5 if door_open else 1.0
+    humidity_mult = 1.2 if humidity else 1.0
+    return shipment_vals * p_loss * (door_mult * humidity_mult)
+
+
+@timed("simulate_cost_distribution")
 def simulate_cost_distribution(
     distance: float,
     door_open: bool,
@@ -92,14 +146,13 @@ def simulate_cost_distribution(
     """Vectorised Monte Carlo of total shipment cost (no Python loops)."""
     if rng is None:
         rng = np.random.default_rng(42)
+    count("engine_mc_samples_total", n)
 
     # ── Operating & travel ──
     mile_cost = rng.uniform(2.20, 2.35, n)
     mph = rng.uniform(30, 55, n)
-    rate_per_mile = (mile_cost * mph) / 60.0
     handling_fee = rng.uniform(100, 500, n)
-    travel_cost = rate_per_mile * distance
-    operating_travel = travel_cost + handling_fee
+    operating_travel = operating_travel_cost(distance, mile_cost, mph, handling_fee)
 
     # ── Delay / service ──
     if shipment_value is not None and shipment_value > 0:
@@ -107,137 +160,122 @@ def simulate_cost_distribution(
     else:
         shipment_vals = rng.triangular(50_000, 75_000, 100_000, n)
 
-    otif_cost = 0.03 * shipment_vals
     detention_rate = rng.uniform(0.5, 0.83, n)
-    detention_cost = detention_rate * max(delay_minutes, 0)
-    delay_service = otif_cost + detention_cost
-
-    # ── Spoilage (exponential P(loss), knee at 4 h) ──
-    lambda_1_base = -np.log(1 - 0.2) / 1.0
-    lambda_6_base = -np.log(1 - 0.8) / 6.0
-    lambda_1 = lambda_1_base * rng.uniform(0.95, 1.05, n)
-    lambda_6 = lambda_6_base * rng.uniform(0.95, 1.05, n)
+    delay_service = delay_service_cost(delay_minutes, shipment_vals, detention_rate)
 
-    t = max(spoilage_time_hours, 0)
-    if t <= 4:
-        p_loss = 1 - np.exp(-lambda_1 * t)
-    else:
-        frac = np.clip((t - 4) / 2.0, 0, 1)
-        lambda_t = lambda_1 + frac * (lambda_6 - lambda_1)
-        p_loss = 1 - np.exp(-lambda_t * t)
-
-    door_mult = 1.5 if door_open else 1.0
-    humidity_mult = 1.2 if humidity else 1.0
-    spoilage_cost = shipment_vals * p_loss * (door_mult * humidity_mult)
+    # ── Spoilage ──
+    lambda_1_jitter = rng.uniform(0.95, 1.05, n)
+    lambda_6_jitter = rng.uniform(0.95, 1.05, n)
+    spoilage = spoilage_cost(
+        spoilage_time_hours, door_open, humidity,
+        shipment_vals, lambda_1_jitter, lambda_6_jitter,
+    )
 
-    total_cost = operating_travel + delay_service + spoilage_cost + fixed_cost
+    total_cost = operating_travel + delay_service + spoilage + fixed_cost
 
     return {
         "total_cost": total_cost,
         "operating_travel": operating_travel,
         "delay_service": delay_service,
-        "spoilage": spoilage_cost,
+        "spoilage": spoilage,
     }
 
 
-def compute_stats(costs: np.ndarray) -> Dict[str, float]:
-    """Summary statistics for a cost distribution array."""
-    return {
+STAT_PERCENTILES = (5, 25, 50, 75, 95)
+
+
+@timed("compute_stats")
+def _stats_and_quantiles(
+    costs: np.ndarray, extra_pcts: Tuple[float, ...] = (),
+) -> Tuple[Dict[str, float], List[float]]:
+    """Summary stats plus any extra percentiles from one sort of the samples."""
+    # Partitioning an already-sorted array is cheap, so sorting once beats
+    # a separate partition per percentile; results are identical.
+    q = np.percentile(np.sort(costs), [0, *STAT_PERCENTILES, 100, *extra_pcts])
+    stats = {
         "mean": float(np.mean(costs)),
-        "median": float(np.median(costs)),
+        "median": float(q[3]),
         "std": float(np.std(costs)),
-        "min": float(np.min(costs)),
-        "max": float(np.max(costs)),
-        "p05": float(np.percentile(costs, 5)),
-        "p25": float(np.percentile(costs, 25)),
-        "p50": float(np.percentile(costs, 50)),
-        "p75": float(np.percentile(costs, 75)),
-        "p95": float(np.percentile(costs, 95)),
+        "min": float(q[0]),
+        "max": float(q[6]),
     }
+    for pct, value in zip(STAT_PERCENTILES, q[1:6]):
+        stats[f"p{pct:02d}"] = float(value)
+    return stats, [float(v) for v in q[7:]]
+
+
+def compute_stats(costs: np.ndarray) -> Dict[str, float]:
+    """Summary statistics for a cost distribution array."""
+    return _stats_and_quantiles(costs)[0]
 
 
 # ── Evaluate all actions for one scenario row ────────────────────────
 
-def evaluate_scenario(
-    row: ScenarioRow,
-    risk_threshold: float = 0.50,
-    n: int = 20_000,
-    seed: int = 42,
-) -> Dict[str, Any]:
-    """Run Monte Carlo for all 3 actions on a scenario row.
+def action_inputs(action_def: Dict[str, Any], row: ScenarioRow) -> Dict[str, Any]:
+    """Derive the simulation inputs for one action on a scenario row."""
+    name = action_def["name"]
+    extra_time = action_def["extra_travel_minutes"] + action_def["extra_handling_minutes"]
 
-    Per action the engine derives:
-        distance  = distance_base × (1 + extra_time / 300)
-        net_delay = max(0, delay_base + extra_time − slack)
-        spoilage  = spoilage_base + (minutes_above_temp + extra_violation) / 60
+    distance = row.distance_base_miles * (1 + extra_time / 300.0)
 
-    Detour forces door_open=0, humidity=0 (cold-chain repaired).
-    Fixed costs (reroute $500, detour $2 000) added post-simulation.
+    if name == "detour":
+        door_open, humidity = False, False
+    else:
+        door_open = bool(row.door_open)
+        humidity = bool(row.high_humidity)
 
-    Quantile scoring (lower wins):
-        risk=0.25 → p75  |  risk=0.50 → p50  |  risk=0.75 → p25
-    """
-    rng = np.random.default_rng(seed)
-    quantile_pct = 1.0 - risk_threshold
-    quantile_label = f"p{int(quantile_pct * 100)}"
+    net_delay = max(0.0, row.delay_base_minutes + extra_time - row.slack_minutes)
 
-    per_action: Dict[str, Any] = {}
-    scores: Dict[str, float] = {}
+    ev = extra_violation_minutes(name, extra_time, row)
+    spoilage_time = row.spoilage_time_base_hours + (row.minutes_above_temp + ev) / 60.0
+
+    return {
+        "distance": distance,
+        "door_open": door_open,
+        "humidity": humidity,
+        "delay_minutes": net_delay,
+        "spoilage_time_hours": spoilage_time,
+        "shipment_value": row.shipment_value,
+        "fixed_cost": action_def["fixed_cost"],
+    }
 
-    for action_def in ACTIONS:
-        name = action_def["name"]
-        extra_travel = action_def["extra_travel_minutes"]
-        extra_handling = action_def["extra_handling_minutes"]
-        fc = action_def["fixed_cost"]
-        extra_time = extra_travel + extra_handling
-
-        distance = row.distance_base_miles * (1 + extra_time / 300.0)
-
-        if name == "detour":
-            door_open, humidity = False, False
-        else:
-            door_open = bool(row.door_open)
-            humidity = bool(row.high_humidity)
-
-        net_delay = max(0.0, row.delay_base_minutes + extra_time - row.slack_minutes)
-
-        ev = extra_violation_minutes(name, extra_time, row)
-        spoilage_time = row.spoilage_time_base_hours + (row.minutes_above_temp + ev) / 60.0
-
-        result = simulate_cost_distribution(
-            distance=distance,
-            door_open=door_open,
-            humidity=humidity,
-            delay_minutes=net_delay,
-            spoilage_time_hours=spoilage_time,
-            shipment_value=row.shipment_value,
-            fixed_cost=fc,
-            n=n,
-            rng=rng,
-        )
 
-        total = result["total_cost"]
-        stats = compute_stats(total)
-        score = float(np.percentile(total, quantile_pct * 100))
-
-        per_action[name] = {
-            "stats": stats,
-            "percentiles": {
-                "p05": stats["p05"],
-                "p25": stats["p25"],
-                "p50": stats["p50"],
-                "p75": stats["p75"],
-                "p95": stats["p95"],
-            },
-            "breakdown_means": {
-                "operating_travel": float(np.mean(result["operating_travel"])),
-                "delay_service": float(np.mean(result["delay_service"])),
-                "spoilage": float(np.mean(result["spoilage"])),
-                "fixed_cost": float(fc),
-            },
-            "score": score,
-        }
-        scores[name] = score
+def summarize_action(
+    result: Dict[str, np.ndarray],
+    fixed_cost: float,
+    quantile_pct: float,
+) -> Dict[str, Any]:
+    """Stats, percentiles, breakdown means and quantile score for one action."""
+    stats, (score,) = _stats_and_quantiles(result["total_cost"], (quantile_pct * 100,))
+
+    return {
+        "stats": stats,
+        "percentiles": {
+            "p05": stats["p05"],
+            "p25": stats["p25"],
+            "p50": stats["p50"],
+            "p75": stats["p75"],
+            "p95": stats["p95"],
+        },
+        "breakdown_means": {
+            "operating_travel": float(np.mean(result["operating_travel"])),
+            "delay_service": float(np.mean(result["delay_service"])),
+            "spoilage": float(np.mean(result["spoilage"])),
+            "fixed_cost": float(fixed_cost),
+        },
+        "score": score,
+    }
+
+
+def build_scenario_result(
+    row: ScenarioRow,
+    per_action: Dict[str, Any],
+    risk_threshold: float,
+) -> Dict[str, Any]:
+    """Choose the action for a row and assemble the engine's result dict."""
+    quantile_pct = 1.0 - risk_threshold
+    quantile_label = f"p{int(quantile_pct * 100)}"
+    scores = {name: a["score"] for name, a in per_action.items()}
 
     # Use the action from CSV/DB if provided; otherwise fall back to quantile scoring
     risk_labels = {0.25: "25% Safe", 0.50: "50% Balanced", 0.75: "75% Cheap"}
@@ -280,6 +318,43 @@ def evaluate_scenario(
     }
 
 
+@timed("evaluate_scenario")
+def evaluate_scenario(
+    row: ScenarioRow,
+    risk_threshold: float = 0.50,
+    n: int = 20_000,
+    seed: int = 42,
+) -> Dict[str, Any]:
+    """Run Monte Carlo for all 3 actions on a scenario row.
+
+    Per action the engine derives:
+        distance  = distance_base × (1 + extra_time / 300)
+        net_delay = max(0, delay_base + extra_time − slack)
+        spoilage  = spoilage_base + (minutes_above_temp + extra_violation) / 60
+
+    Detour forces door_open=0, humidity=0 (cold-chain repaired).
+    Fixed costs (reroute $500, detour $2 000) added post-simulation.
+
+    Quantile scoring (lower wins):
+        risk=0.25 → p75  |  risk=0.50 → p50  |  risk=0.75 → p25
+    """
+    rng = np.random.default_rng(seed)
+    quantile_pct = 1.0 - risk_threshold
+
+    per_action: Dict[str, Any] = {}
+
+    for action_def in ACTIONS:
+        inputs = action_inputs(action_def, row)
+        result = simulate_cost_distribution(**inputs, n=n, rng=rng)
+        per_action[action_def["name"]] = summarize_action(
+            result, inputs["fixed_cost"], quantile_pct,
+        )
+
+    result = build_scenario_result(row, per_action, risk_threshold)
+    result["mc_samples"] = n
+    return result
+
+
 # ── CSV reader ───────────────────────────────────────────────────────
 
 def read_scenarios_from_csv(csv_path: str) -> List[ScenarioRow]:
@@ -304,6 +379,7 @@ def read_scenarios_from_csv(csv_path: str) -> List[ScenarioRow]:
                 spoilage_time_base_hours=float(r["spoilage_time_base_hours"]),
                 shipment_value=float(sv) if sv else None,
                 recommended_action=r.get("recommended_action", "").strip() or None,
+                t=float(r["t"]) if r.get("t", "").strip() else None,
             ))
     return rows
 
@@ -311,6 +387,7 @@ def read_scenarios_from_csv(csv_path: str) -> List[ScenarioRow]:
 # ── CLI: reads JSON from stdin, writes JSON to stdout ────────────────
 
 if __name__ == "__main__":
+    dump_at_exit()
     input_data = json.loads(sys.stdin.read())
 
     risk_threshold = input_data.get("risk_threshold", 0.50)
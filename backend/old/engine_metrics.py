@@ -0,0 +1,20 @@
+"""
+Instrumentation for the engines: backend/metrics.py, however they are run.
+
+Running ``python old/cost_engine.py`` puts backend/old first on sys.path,
+so backend/ is appended here to make ``metrics`` importable. Engine timers
+and counters land in the registry of the process running the engines; the
+API server does not run them. To see them from an engine CLI, set
+METRICS_DUMP=stderr (or a file path) and call dump_at_exit() from the CLI.
+"""
+
+import os
+import sys
+
+_BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if _BACKEND_DIR not in sys.path:
+    sys.path.append(_BACKEND_DIR)
+
+from metrics import count, dump_at_exit, timed  # noqa: E402
+
+__all__ = ["count", "dump_at_exit", "timed"]
@@ -22,6 +22,7 @@ from cost_engine import (
     ScenarioRow,
     evaluate_scenario,
 )
+from engine_metrics import dump_at_exit, timed
 
 # ── Constants ─────────────────────────────────────────────────────────
 
@@ -112,6 +113,7 @@ def spoilage_cost_saved(
 
 # ── Full environmental impact for one truck ──────────────────────────
 
+@timed("compute_truck_environmental_impact")
 def compute_truck_environmental_impact(
     scenario_result: Dict[str, Any],
     row: ScenarioRow,
@@ -176,6 +178,7 @@ def compute_truck_environmental_impact(
 # ── CLI ──────────────────────────────────────────────────────────────
 
 if __name__ == "__main__":
+    dump_at_exit()
     from cost_engine import read_scenarios_from_csv
 
     input_data = json.loads(sys.stdin.read())
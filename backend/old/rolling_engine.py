@@ -0,0 +1,278 @@
+"""
+Rolling Trip Evaluator for Cold-Chain Trucking.
+
+Replays a truck's time series (one ScenarioRow per tick) through the cost
+engine without paying for a full independent evaluation at every tick.
+
+State carried from tick to tick:
+    - shared draws:  each action's Monte Carlo samples (mile cost, mph,
+      handling, shipment value, detention rate, spoilage jitter) are drawn
+      once per truck and reused, so tick-to-tick differences reflect the
+      inputs rather than sampling noise (common random numbers).
+    - component cache: operating/travel, delay/service and spoilage arrays
+      are keyed by the inputs they depend on and only recomputed when
+      those inputs change.
+    - previous quantile estimates: if no component of an action changed,
+      its stats and score are reused without re-sorting the samples.
+
+Trip telemetry (reported per tick, not fed back into the simulation):
+    - accumulated violation minutes: total minutes above temperature
+      observed across the trip, robust to sensor resets. Spoilage is still
+      driven by each row's own ``minutes_above_temp``.
+
+Scoring and action choice are identical to ``evaluate_scenario``.
+"""
+
+import json
+import sys
+from dataclasses import dataclass, field
+from itertools import groupby
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from cost_engine import (
+    ACTIONS,
+    ScenarioRow,
+    action_inputs,
+    build_scenario_result,
+    delay_service_cost,
+    operating_travel_cost,
+    read_scenarios_from_csv,
+    spoilage_cost,
+    summarize_action,
+)
+from engine_metrics import count, dump_at_exit, timed
+
+
+# ── Shared draws ─────────────────────────────────────────────────────
+
+def draw_action_samples(n: int, rng: np.random.Generator) -> Dict[str, np.ndarray]:
+    """Draw every random input of ``simulate_cost_distribution`` once."""
+    count("engine_mc_samples_total", n)
+    return {
+        "mile_cost": rng.uniform(2.20, 2.35, n),
+        "mph": rng.uniform(30, 55, n),
+        "handling_fee": rng.uniform(100, 500, n),
+        "shipment_vals": rng.triangular(50_000, 75_000, 100_000, n),
+        "detention_rate": rng.uniform(0.5, 0.83, n),
+        "lambda_1_jitter": rng.uniform(0.95, 1.05, n),
+        "lambda_6_jitter": rng.uniform(0.95, 1.05, n),
+    }
+
+
+def _copy_summary(summary: Dict[str, Any]) -> Dict[str, Any]:
+    """Copy a cached action summary so results from different ticks don't alias."""
+    return {k: dict(v) if isinstance(v, dict) else v for k, v in summary.items()}
+
+
+def _shipment_key(shipment_value: Optional[float]) -> Optional[float]:
+    """Cache key for the shipment value (None → sampled distribution)."""
+    if shipment_value is not None and shipment_value > 0:
+        return float(shipment_value)
+    return None
+
+
+@dataclass
+class _ActionState:
+    """Cached component arrays and last summary for one action."""
+    draws: Dict[str, np.ndarray]
+    keys: Dict[str, Tuple] = field(default_factory=dict)
+    components: Dict[str, np.ndarray] = field(default_factory=dict)
+    summary: Optional[Dict[str, Any]] = None
+
+
+# ── Rolling evaluator ────────────────────────────────────────────────
+
+class RollingEvaluator:
+    """Stream one truck's rows in time order, carrying simulation state."""
+
+    def __init__(
+        self,
+        truck_id: int,
+        risk_threshold: float = 0.50,
+        n: int = 20_000,
+        seed: int = 42,
+    ):
+        self.truck_id = truck_id
+        self.risk_threshold = risk_threshold
+        self.n = n
+        self.quantile_pct = 1.0 - risk_threshold
+
+        rng = np.random.default_rng(seed)
+        self._actions = {
+            a["name"]: _ActionState(draws=draw_action_samples(n, rng)) for a in ACTIONS
+        }
+        self.ticks = 0
+        self.last_t: Optional[float] = None
+        self.last_action: Optional[str] = None
+        self.accumulated_violation_minutes = 0.0
+        self._last_minutes_above_temp = 0.0
+
+    def _shipment_vals(self, state: _ActionState, key: Optional[float]) -> np.ndarray:
+        if key is None:
+            return state.draws["shipment_vals"]
+        return np.full(self.n, key)
+
+    def _update_action(
+        self, state: _ActionState, inputs: Dict[str, Any],
+    ) -> List[str]:
+        """Recompute only the components whose inputs changed; return their names."""
+        d = state.draws
+        ship = _shipment_key(inputs["shipment_value"])
+        keys = {
+            "operating_travel": (inputs["distance"],),
+            "delay_service": (inputs["delay_minutes"], ship),
+            "spoilage": (
+                inputs["spoilage_time_hours"], inputs["door_open"], inputs["humidity"], ship,
+            ),
+        }
+
+        changed = [c for c, k in keys.items() if state.keys.get(c) != k]
+        if not changed:
+            return changed
+
+        if "operating_travel" in changed:
+            state.components["operating_travel"] = operating_travel_cost(
+                inputs["distance"], d["mile_cost"], d["mph"], d["handling_fee"],
+            )
+        if "delay_service" in changed:
+            state.components["delay_service"] = delay_service_cost(
+                inputs["delay_minutes"], self._shipment_vals(state, ship), d["detention_rate"],
+            )
+        if "spoilage" in changed:
+            state.components["spoilage"] = spoilage_cost(
+                inputs["spoilage_time_hours"], inputs["door_open"], inputs["humidity"],
+                self._shipment_vals(state, ship), d["lambda_1_jitter"], d["lambda_6_jitter"],
+            )
+
+        c = state.components
+        result = dict(
+            c,
+            total_cost=c["operating_travel"] + c["delay_service"] + c["spoilage"]
+            + inputs["fixed_cost"],
+        )
+        state.summary = summarize_action(result, inputs["fixed_cost"], self.quantile_pct)
+        state.keys = keys
+        return changed
+
+    @timed("rolling_step")
+    def step(self, row: ScenarioRow) -> Dict[str, Any]:
+        """Score the next tick; returns an ``evaluate_scenario`` result plus trip state."""
+        if row.truck_id != self.truck_id:
+            raise ValueError(
+                f"Row for truck {row.truck_id} passed to evaluator for truck {self.truck_id}"
+            )
+        if row.t is not None and self.last_t is not None and row.t < self.last_t:
+            raise ValueError(
+                f"Rows for truck {self.truck_id} out of time order: {row.t} < {self.last_t}"
+            )
+
+        per_action: Dict[str, Any] = {}
+        resimulated: Dict[str, List[str]] = {}
+        for action_def in ACTIONS:
+            name = action_def["name"]
+            state = self._actions[name]
+            changed = self._update_action(state, action_inputs(action_def, row))
+            if changed:
+                resimulated[name] = changed
+            per_action[name] = _copy_summary(state.summary)
+
+        self.accumulated_violation_minutes += max(
+            0.0, row.minutes_above_temp - self._last_minutes_above_temp
+        )
+        self._last_minutes_above_temp = row.minutes_above_temp
+
+        result = build_scenario_result(row, per_action, self.risk_threshold)
+        result["t"] = row.t
+        result["mc_samples"] = self.n
+        result["tick"] = self.ticks
+        result["resimulated"] = resimulated
+        result["accumulated_violation_minutes"] = self.accumulated_violation_minutes
+        result["action_changed"] = (
+            self.last_action is not None and result["recommended_action"] != self.last_action
+        )
+
+        self.ticks += 1
+        if row.t is not None:
+            self.last_t = row.t
+        self.last_action = result["recommended_action"]
+        return result
+
+
+# ── Trip / fleet replay ──────────────────────────────────────────────
+
+def _time_ordered(rows: Iterable[ScenarioRow]) -> List[ScenarioRow]:
+    """Sort rows by ``t`` when every row has one; otherwise keep stream order."""
+    rows = list(rows)
+    if all(r.t is not None for r in rows):
+        rows.sort(key=lambda r: r.t)
+    return rows
+
+
+def evaluate_trip(
+    rows: Iterable[ScenarioRow],
+    risk_threshold: float = 0.50,
+    n: int = 20_000,
+    seed: int = 42,
+) -> Iterator[Dict[str, Any]]:
+    """Yield one rolling result per tick for a single truck's rows."""
+    evaluator: Optional[RollingEvaluator] = None
+    for row in _time_ordered(rows):
+        if evaluator is None:
+            evaluator = RollingEvaluator(row.truck_id, risk_threshold, n, seed)
+        yield evaluator.step(row)
+
+
+def decision_timeline(results: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Compact per-tick view of rolling results."""
+    timeline = []
+    for r in results:
+        chosen = r["recommended_action"]
+        timeline.append({
+            "t": r["t"],
+            "tick": r["tick"],
+            "node_id": r["node_id"],
+            "recommended_action": chosen,
+            "score": r["per_action"][chosen]["score"],
+            "mean_cost": r["per_action"][chosen]["stats"]["mean"],
+            "action_changed": r["action_changed"],
+            "accumulated_violation_minutes": r["accumulated_violation_minutes"],
+            "resimulated": r["resimulated"],
+        })
+    return timeline
+
+
+def replay_fleet(
+    rows: Iterable[ScenarioRow],
+    risk_threshold: float = 0.50,
+    n: int = 20_000,
+    seed: int = 42,
+) -> Dict[int, List[Dict[str, Any]]]:
+    """Decision timeline per truck; each truck seeded with ``seed + truck_id``."""
+    by_truck = sorted(rows, key=lambda r: r.truck_id)
+    timelines: Dict[int, List[Dict[str, Any]]] = {}
+    for truck_id, truck_rows in groupby(by_truck, key=lambda r: r.truck_id):
+        timelines[truck_id] = decision_timeline(
+            evaluate_trip(truck_rows, risk_threshold, n, seed + truck_id)
+        )
+    return timelines
+
+
+# ── CLI: reads JSON from stdin, writes JSON to stdout ────────────────
+
+if __name__ == "__main__":
+    dump_at_exit()
+    input_data = json.loads(sys.stdin.read())
+
+    risk_threshold = input_data.get("risk_threshold", 0.50)
+    n = input_data.get("n", 20_000)
+    seed = input_data.get("seed", 42)
+
+    if "csv_path" in input_data:
+        scenarios = read_scenarios_from_csv(input_data["csv_path"])
+    else:
+        scenarios = [ScenarioRow(**truck) for truck in input_data.get("trucks", [])]
+
+    timelines = replay_fleet(scenarios, risk_threshold, n, seed)
+    json.dump({str(k): v for k, v in timelines.items()}, sys.stdout)
@@ -0,0 +1,125 @@
+"""
+Unit tests for the Rolling Trip Evaluator.
+
+Run with:
+    cd backend && python -m pytest test_rolling_engine.py -v
+"""
+
+import numpy as np
+import pytest
+
+from cost_engine import compute_stats, summarize_action
+from rolling_engine import (
+    RollingEvaluator,
+    decision_timeline,
+    evaluate_trip,
+    replay_fleet,
+)
+from test_environmental_sroi import _make_scenario
+
+
+def _trip(truck_id=1):
+    return [
+        _make_scenario(truck_id=truck_id, t=0.0, minutes_above_temp=0.0),
+        _make_scenario(truck_id=truck_id, t=60.0, minutes_above_temp=0.0, slack_minutes=5.0),
+        _make_scenario(truck_id=truck_id, t=120.0, minutes_above_temp=30.0, door_open=1),
+        _make_scenario(truck_id=truck_id, t=180.0, minutes_above_temp=30.0, door_open=1),
+    ]
+
+
+# ── Tests: RollingEvaluator ───────────────────────────────────────────
+
+class TestRollingEvaluator:
+    def test_cached_result_matches_fresh_evaluation(self):
+        """Carrying state forward must not change the result at a tick."""
+        rows = _trip()
+        rolled = list(evaluate_trip(rows, 0.5, 2000, 42))
+        fresh = RollingEvaluator(1, 0.5, 2000, 42).step(rows[-1])
+        for name, action in fresh["per_action"].items():
+            assert rolled[-1]["per_action"][name]["stats"] == action["stats"]
+            assert rolled[-1]["per_action"][name]["score"] == action["score"]
+
+    def test_only_changed_components_resimulated(self):
+        rows = _trip()
+        results = list(evaluate_trip(rows, 0.5, 2000, 42))
+        assert set(results[0]["resimulated"]["continue"]) == {
+            "operating_travel", "delay_service", "spoilage",
+        }
+        # Slack change only moves delay for every action
+        assert results[1]["resimulated"]["continue"] == ["delay_service"]
+        # Identical inputs → nothing re-simulated, previous estimates reused
+        assert results[3]["resimulated"] == {}
+        assert results[3]["per_action"] == results[2]["per_action"]
+
+    def test_reused_summaries_not_shared_between_ticks(self):
+        rows = _trip()
+        results = list(evaluate_trip(rows, 0.5, 1000, 42))
+        results[3]["per_action"]["continue"]["stats"]["mean"] = -1.0
+        results[3]["per_action"]["continue"]["score"] = -1.0
+        assert results[2]["per_action"]["continue"]["stats"]["mean"] > 0
+        assert results[2]["per_action"]["continue"]["score"] > 0
+
+    def test_accumulated_violation_minutes(self):
+        rows = _trip() + [
+            _make_scenario(t=240.0, minutes_above_temp=0.0),
+            _make_scenario(t=300.0, minutes_above_temp=10.0),
+        ]
+        results = list(evaluate_trip(rows, 0.5, 1000, 42))
+        assert [r["accumulated_violation_minutes"] for r in results] == [
+            0.0, 0.0, 30.0, 30.0, 30.0, 40.0,
+        ]
+
+    def test_rows_sorted_by_time(self):
+        rows = list(reversed(_trip()))
+        results = list(evaluate_trip(rows, 0.5, 1000, 42))
+        assert [r["t"] for r in results] == [0.0, 60.0, 120.0, 180.0]
+
+    def test_out_of_order_step_rejected(self):
+        ev = RollingEvaluator(1, 0.5, 1000, 42)
+        ev.step(_make_scenario(t=60.0))
+        with pytest.raises(ValueError):
+            ev.step(_make_scenario(t=0.0))
+
+    def test_wrong_truck_rejected(self):
+        ev = RollingEvaluator(1, 0.5, 1000, 42)
+        with pytest.raises(ValueError):
+            ev.step(_make_scenario(truck_id=2))
+
+
+# ── Tests: single-pass stats ──────────────────────────────────────────
+
+class TestStats:
+    def test_matches_separate_numpy_reductions(self):
+        costs = np.random.default_rng(0).gamma(2.0, 5_000.0, 5_001)
+        stats = compute_stats(costs)
+        assert stats["median"] == np.median(costs)
+        assert stats["min"] == costs.min() and stats["max"] == costs.max()
+        for pct in (5, 25, 50, 75, 95):
+            assert stats[f"p{pct:02d}"] == np.percentile(costs, pct)
+
+    def test_score_is_requested_quantile(self):
+        costs = np.random.default_rng(1).gamma(2.0, 5_000.0, 2_000)
+        result = {"total_cost": costs, "operating_travel": costs,
+                  "delay_service": costs, "spoilage": costs}
+        summary = summarize_action(result, 0.0, 0.75)
+        assert summary["score"] == np.percentile(costs, 75)
+
+
+# ── Tests: fleet replay ───────────────────────────────────────────────
+
+class TestReplayFleet:
+    def test_timeline_per_truck(self):
+        rows = _trip(1) + _trip(2)
+        timelines = replay_fleet(rows, 0.5, 1000, 42)
+        assert sorted(timelines) == [1, 2]
+        assert len(timelines[1]) == 4
+        assert timelines[1][0]["action_changed"] is False
+
+    def test_timeline_matches_trip(self):
+        rows = _trip(3)
+        expected = decision_timeline(evaluate_trip(rows, 0.5, 1000, 45))
+        assert replay_fleet(rows, 0.5, 1000, 42)[3] == expected
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -3,19 +3,61 @@ Flask API server for fleet data.
 Pulls all data from fleet_decisions_full_6 (single table on Aiven).
 Returns the raw table as-is - no split into decisions, gps, sensors.
 Designed for deployment on Render.
+
+If FLEET_SNAPSHOT_DIR is set, /api/fleet-data is served from the local
+columnar snapshot (see fleet_snapshot.py). Once it is older than
+FLEET_SNAPSHOT_MAX_AGE seconds it is refreshed incrementally in a
+background thread while the current snapshot keeps being served. Past
+FLEET_SNAPSHOT_MAX_STALE seconds the refresh runs in the request, and if
+it fails the endpoint returns 503 rather than serving older data. Every
+snapshot response carries its age in an X-Snapshot-Age header.
+
+Hot-path stages are timed and exposed at /metrics (see metrics.py);
+append ?timing=1 for a Server-Timing header or, with PROFILING_ENABLED,
+?profile=cpu|mem for a per-request profile dump (one at a time per
+worker; the dump path is logged, not returned to the client).
 """
 
 import os
-from flask import Flask, jsonify
+import threading
+import time
+from flask import Flask, Response, g, jsonify, request
 from flask_cors import CORS
 from dotenv import load_dotenv
 import psycopg2
 from psycopg2.extras import RealDictCursor
 
+import metrics
+from fleet_snapshot import load_snapshot, read_manifest, refresh_snapshot, snapshot_age
+from metrics import count, stage
+
 load_dotenv()
 
 app = Flask(__name__)
-CORS(app, resources={r"/api/*": {"origins": "*"}})
+CORS(app, resources={r"/api/*": {"origins": "*", "expose_headers": ["X-Snapshot-Age"]}})
+
+SNAPSHOT_DIR = os.environ.get("FLEET_SNAPSHOT_DIR")
+SNAPSHOT_MAX_AGE = float(os.environ.get("FLEET_SNAPSHOT_MAX_AGE", "60"))
+SNAPSHOT_MAX_STALE = float(os.environ.get("FLEET_SNAPSHOT_MAX_STALE", "900"))
+
+# (snapshot version, serialized rows) for the current process
+_snapshot_cache = {"version": None, "rows": None}
+
+# At most one background refresh per process
+_refresh_lock = threading.Lock()
+_refresh_thread = None
+
+
+class SnapshotTooStale(Exception):
+    """The snapshot is past SNAPSHOT_MAX_STALE and could not be refreshed."""
+
+    def __init__(self, age, cause):
+        super().__init__(
+            f"Fleet snapshot is {age:.0f}s old (limit {SNAPSHOT_MAX_STALE:.0f}s) "
+            f"and the database refresh failed: {cause}"
+        )
+        self.age = age
+
 
 def get_db_connection():
     """Create a database connection using DATABASE_URL from env."""
@@ -51,9 +93,72 @@ def fetch_fleet_table(conn):
     Returns one array of full rows, no split into decisions/gps/sensors.
     """
     with conn.cursor() as cur:
-        cur.execute("SELECT * FROM fleet_decisions_full_6")
-        rows = cur.fetchall()
-    return [_row_to_dict(dict(r)) for r in rows]
+        with stage("db_execute"):
+            cur.execute("SELECT * FROM fleet_decisions_full_6")
+        with stage("db_fetchall"):
+            rows = cur.fetchall()
+    count("fleet_rows_total", len(rows), source="db")
+    with stage("serialize"):
+        return [_row_to_dict(dict(r)) for r in rows]
+
+
+def _refresh_snapshot(wait=True):
+    with stage("db_connect"):
+        conn = get_db_connection()
+    try:
+        with stage("snapshot_refresh"):
+            return refresh_snapshot(conn, SNAPSHOT_DIR, max_age=SNAPSHOT_MAX_AGE, wait=wait)
+    finally:
+        conn.close()
+
+
+def _background_refresh():
+    try:
+        # Skips straight out if another worker already holds the refresh lock
+        _refresh_snapshot(wait=False)
+    except Exception as e:
+        app.logger.warning("Background snapshot refresh failed, serving stale snapshot: %s", e)
+        count("fleet_snapshot_refresh_errors_total")
+
+
+def _start_background_refresh():
+    global _refresh_thread
+    with _refresh_lock:
+        if _refresh_thread is not None and _refresh_thread.is_alive():
+            return
+        _refresh_thread = threading.Thread(
+            target=_background_refresh, name="fleet-snapshot-refresh", daemon=True,
+        )
+        _refresh_thread.start()
+
+
+def fetch_fleet_snapshot():
+    """
+    (rows, manifest) from the local snapshot. A snapshot older than
+    SNAPSHOT_MAX_AGE is served while a background refresh runs; one that is
+    missing or older than SNAPSHOT_MAX_STALE is refreshed in the request,
+    raising SnapshotTooStale if that fails. Serialized rows are cached per
+    snapshot version.
+    """
+    manifest = read_manifest(SNAPSHOT_DIR)
+    if manifest is None or snapshot_age(manifest) > SNAPSHOT_MAX_STALE:
+        try:
+            manifest = _refresh_snapshot()
+        except Exception as e:
+            if manifest is None:
+                raise
+            app.logger.warning("Snapshot refresh failed: %s", e)
+            count("fleet_snapshot_refresh_errors_total")
+            raise SnapshotTooStale(snapshot_age(manifest), e) from e
+    elif snapshot_age(manifest) > SNAPSHOT_MAX_AGE:
+        _start_background_refresh()
+
+    if _snapshot_cache["version"] != manifest["version"]:
+        with stage("snapshot_load"):
+            _snapshot_cache["rows"] = load_snapshot(SNAPSHOT_DIR).rows()
+        _snapshot_cache["version"] = manifest["version"]
+    count("fleet_rows_total", len(_snapshot_cache["rows"]), source="snapshot")
+    return _snapshot_cache["rows"], manifest
 
 
 @app.route("/api/fleet-data", methods=["GET"])
@@ -63,16 +168,76 @@ def get_fleet_data():
     Same columns and structure as in PostgreSQL - no decisions/gps/sensors split.
     """
     try:
-        conn = get_db_connection()
-        try:
-            rows = fetch_fleet_table(conn)
-        finally:
-            conn.close()
-        return jsonify({"rows": rows})
+        if SNAPSHOT_DIR:
+            rows, manifest = fetch_fleet_snapshot()
+        else:
+            with stage("db_connect"):
+                conn = get_db_connection()
+            try:
+                rows = fetch_fleet_table(conn)
+            finally:
+                conn.close()
+            manifest = None
+        with stage("jsonify"):
+            response = jsonify({"rows": rows})
+        if manifest is not None:
+            response.headers["X-Snapshot-Age"] = f"{snapshot_age(manifest):.0f}"
+        return response
+    except SnapshotTooStale as e:
+        response = jsonify({"error": str(e)})
+        response.headers["X-Snapshot-Age"] = f"{e.age:.0f}"
+        return response, 503
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
+@app.before_request
+def _start_request_instrumentation():
+    g.request_started = time.perf_counter()
+    g.server_timing = metrics.ENABLED and (
+        metrics.SERVER_TIMING or request.args.get("timing") == "1"
+    )
+    if g.server_timing:
+        metrics.start_request_timings()
+    mode = request.args.get("profile") if metrics.PROFILING_ENABLED else None
+    g.profiler = None
+    if mode in ("cpu", "mem"):
+        g.profiler = metrics.RequestProfiler(mode, request.endpoint or "request").start()
+        if g.profiler is None:
+            app.logger.info("profile=%s skipped: another request is being profiled", mode)
+
+
+@app.after_request
+def _finish_request_instrumentation(response):
+    if metrics.ENABLED and "request_started" in g:
+        endpoint = request.endpoint or "unknown"
+        elapsed = time.perf_counter() - g.request_started
+        metrics.observe("fleet_request_duration_seconds", elapsed, endpoint=endpoint)
+        count("fleet_requests_total", endpoint=endpoint, status=str(response.status_code))
+        if response.content_length is not None:
+            count("fleet_response_bytes_total", response.content_length, endpoint=endpoint)
+    if g.get("server_timing"):
+        timings = metrics.pop_request_timings()
+        timings.append(("total", time.perf_counter() - g.request_started))
+        response.headers["Server-Timing"] = metrics.server_timing_header(timings)
+    return response
+
+
+@app.teardown_request
+def _stop_request_profiler(exc):
+    # Runs even when the request raised, so a profiler is never left enabled
+    profiler = g.pop("profiler", None)
+    if profiler is not None:
+        path = profiler.stop()
+        app.logger.info("profile dump written to %s", path)
+
+
+@app.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    """Prometheus scrape endpoint for this worker's stage timers and counters."""
+    return Response(metrics.REGISTRY.render(), mimetype="text/plain; version=0.0.4")
+
+
 @app.route("/health", methods=["GET"])
 def health():
     """Health check endpoint for Render and load balancers."""
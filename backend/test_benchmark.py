@@ -0,0 +1,118 @@
+"""
+Unit tests for the benchmark suite's regression compare and case building.
+
+Run with:
+    cd backend && python -m pytest test_benchmark.py -v
+"""
+
+import os
+import re
+
+import pytest
+
+import benchmark
+from benchmark import FLEET_COLUMNS, compare, engine_cases, measure, synthetic_fleet_rows
+
+FLEET_ROW_TS = os.path.join(os.path.dirname(__file__), "..", "lib", "fleet-from-aiven.ts")
+
+
+# ── Fixtures ──────────────────────────────────────────────────────────
+
+def _report(**cases):
+    return {
+        "results": {
+            name: {"latency_ms": {"p50": p50}, "peak_memory_bytes": peak}
+            for name, (p50, peak) in cases.items()
+        }
+    }
+
+
+# ── Tests: compare ────────────────────────────────────────────────────
+
+class TestCompare:
+    def test_latency_regression_above_threshold(self):
+        regressions = compare(_report(a=(10.0, 100)), _report(a=(11.5, 100)), threshold=0.10)
+        assert regressions == [{
+            "case": "a",
+            "metric": "latency_p50_ms",
+            "baseline": 10.0,
+            "current": 11.5,
+            "change": 0.15,
+        }]
+
+    def test_memory_regression_above_threshold(self):
+        regressions = compare(_report(a=(10.0, 100)), _report(a=(10.0, 200)))
+        assert [r["metric"] for r in regressions] == ["peak_memory_bytes"]
+
+    def test_within_threshold_or_faster_not_flagged(self):
+        assert compare(_report(a=(10.0, 100)), _report(a=(10.5, 105)), threshold=0.10) == []
+        assert compare(_report(a=(10.0, 100)), _report(a=(5.0, 50))) == []
+
+    def test_cases_missing_from_baseline_ignored(self):
+        assert compare(_report(a=(10.0, 100)), _report(b=(99.0, 999))) == []
+
+    def test_zero_baseline_not_flagged(self):
+        assert compare(_report(a=(0.0, 0)), _report(a=(1.0, 10))) == []
+
+
+# ── Tests: cases ──────────────────────────────────────────────────────
+
+class TestCases:
+    def test_engine_cases_build_nothing_until_run(self, monkeypatch):
+        def boom(*args, **kwargs):
+            raise AssertionError("case data built eagerly")
+
+        monkeypatch.setattr(benchmark, "synthetic_scenarios", boom)
+        cases = engine_cases(benchmark.PRESETS["full"])
+        assert len({name for name, _, _ in cases}) == len(cases)
+
+    def test_database_seeded_once_per_size(self, monkeypatch):
+        seeded = []
+        monkeypatch.setattr(benchmark, "seed_fleet_table", lambda url, n: seeded.append(n))
+        monkeypatch.delenv("DATABASE_URL", raising=False)
+
+        class FakeServer:
+            SNAPSHOT_DIR = "unused"
+
+        db = benchmark._BenchDatabase(FakeServer, "postgresql://bench")
+        for name, _, build in benchmark._api_cases_for(db, None, 10):
+            if not name.startswith(("api/fetch", "api/fleet-data")):
+                continue
+            build()
+        db.ensure(20)
+        db.ensure(20)
+        assert seeded == [10, 20]
+        assert FakeServer.SNAPSHOT_DIR is None
+
+
+# ── Tests: measure ────────────────────────────────────────────────────
+
+class TestMeasure:
+    def test_reports_engine_stage_breakdown(self):
+        build = dict((name, b) for name, _, b in engine_cases(benchmark.PRESETS["quick"]))
+        result = measure(build["evaluate_scenario/n=1000"](), 1_000, repeats=2)
+        stages = result["stages"]
+        assert stages["evaluate_scenario"]["calls_per_run"] == 1
+        assert stages["simulate_cost_distribution"]["calls_per_run"] == 3
+        assert stages["compute_stats"]["calls_per_run"] == 3
+        assert 0 < stages["compute_stats"]["ms_per_run"] <= stages["evaluate_scenario"]["ms_per_run"]
+
+
+# ── Tests: seeded fleet table ─────────────────────────────────────────
+
+class TestFleetFixture:
+    def test_columns_match_frontend_fleet_row(self):
+        with open(FLEET_ROW_TS) as f:
+            body = re.search(r"interface FleetRow \{(.*?)\n\}", f.read(), re.S).group(1)
+        fields = re.findall(r"^\s+(\w+)\??:", body, re.M)
+        assert [name for name, _ in FLEET_COLUMNS] == fields
+
+    def test_rows_fill_every_column(self):
+        rows = synthetic_fleet_rows(3)
+        names = [name for name, _ in FLEET_COLUMNS]
+        assert all(list(r) == names for r in rows)
+        assert all(v is not None for r in rows for v in r.values())
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,201 @@
+"""
+Unit tests for the decision_data bulk writer (no database needed).
+
+Run with:
+    cd backend && python -m pytest test_decision_writer.py -v
+"""
+
+import csv
+import io
+import json
+
+import pytest
+
+from decision_writer import (
+    COLUMNS,
+    COPY_SQL,
+    LOCK_SQL,
+    MERGE_SQL,
+    DecisionWriter,
+    decision_row,
+)
+
+
+# ── Fixtures ──────────────────────────────────────────────────────────
+
+def _make_result(truck_id=1, **overrides):
+    per_action = {
+        name: {
+            "stats": {"mean": mean},
+            "score": mean + 1,
+            "breakdown_means": {
+                "operating_travel": 1.0, "delay_service": 2.0, "spoilage": 3.0, "fixed_cost": 0.0,
+            },
+        }
+        for name, mean in (("continue", 100.0), ("reroute", 200.0), ("detour", 300.0))
+    }
+    result = dict(
+        truck_id=truck_id,
+        node_id=10,
+        per_action=per_action,
+        recommended_action="continue",
+        rationale="cheapest",
+        mc_samples=5000,
+    )
+    result.update(overrides)
+    return result
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query, params=()):
+        if query == MERGE_SQL and self.conn.fail_merge:
+            raise RuntimeError("merge failed")
+        self.conn.executed.append(query)
+
+    def copy_expert(self, query, buf):
+        assert query == COPY_SQL
+        self.conn.pending.extend(csv.reader(io.StringIO(buf.read())))
+
+
+class FakeConnection:
+    """Tracks what a transaction would have committed."""
+
+    def __init__(self):
+        self.executed = []
+        self.pending = []
+        self.committed = []
+        self.commits = 0
+        self.rollbacks = 0
+        self.fail_merge = False
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.committed.extend(self.pending)
+        self.pending = []
+        self.commits += 1
+
+    def rollback(self):
+        self.pending = []
+        self.rollbacks += 1
+
+
+# ── Tests: decision_row ───────────────────────────────────────────────
+
+class TestDecisionRow:
+    def test_columns_and_values(self):
+        row = decision_row(_make_result(), timestamp="2025-01-01T12:00:00+02:00")
+        assert len(row) == len(COLUMNS)
+        record = dict(zip(COLUMNS, row))
+        assert record["timestamp"] == "2025-01-01 10:00:00"
+        assert record["mean_cost"] == 100.0
+        assert record["mc_samples"] == 5000
+        actions = json.loads(record["all_actions"])
+        assert [a["action"] for a in actions] == ["continue", "reroute", "detour"]
+        assert "fixed_cost" not in actions[0]["mean_cost_components"]
+        assert json.loads(record["route"]) == {"current_node": 10}
+
+    def test_mc_samples_from_result_over_argument(self):
+        row = decision_row(_make_result(), timestamp="2025-01-01T00:00:00", mc_samples=99)
+        assert row[COLUMNS.index("mc_samples")] == 5000
+
+    def test_mc_samples_argument_for_results_without_it(self):
+        result = _make_result()
+        del result["mc_samples"]
+        row = decision_row(result, timestamp="2025-01-01T00:00:00", mc_samples=1000)
+        assert row[COLUMNS.index("mc_samples")] == 1000
+        with pytest.raises(ValueError):
+            decision_row(result, timestamp="2025-01-01T00:00:00")
+
+    def test_timestamp_required(self):
+        with pytest.raises(ValueError):
+            decision_row(_make_result())
+
+    def test_relative_tick_not_used_as_timestamp(self):
+        with pytest.raises(ValueError):
+            decision_row(_make_result(t=60.0))
+
+    def test_epoch_t_when_requested(self):
+        row = decision_row(_make_result(t=60.0), t_is_epoch=True)
+        assert row[1] == "1970-01-01 00:01:00"
+
+    def test_same_timestamp_gives_same_key(self):
+        r1 = decision_row(_make_result(), timestamp="2025-01-01T00:00:00")
+        r2 = decision_row(_make_result(), timestamp="2025-01-01T00:00:00")
+        assert r1[:2] == r2[:2]
+
+
+# ── Tests: DecisionWriter ─────────────────────────────────────────────
+
+class TestDecisionWriter:
+    def test_batches_and_checkpoints(self):
+        conn = FakeConnection()
+        writer = DecisionWriter(conn, batch_size=2, checkpoint_every=2)
+        report = writer.write(
+            [_make_result(i) for i in range(5)], timestamp="2025-01-01T00:00:00",
+        )
+        assert report["rows_written"] == 5
+        assert report["rows_committed"] == 5
+        assert report["batches"] == 3
+        # two full batches → one checkpoint, final partial batch → one more
+        assert report["checkpoints"] == 2
+        assert len(conn.committed) == 5
+        assert conn.executed.count(MERGE_SQL) == 3
+        # Every merge is preceded by the advisory lock
+        merges = [i for i, q in enumerate(conn.executed) if q == MERGE_SQL]
+        assert all(conn.executed[i - 1] == LOCK_SQL for i in merges)
+
+    def test_empty_reason_is_quoted_not_null(self):
+        writer = DecisionWriter(FakeConnection())
+        writer.add(_make_result(rationale=""), timestamp="2025-01-01T00:00:00")
+        line = writer._buffer.getvalue()
+        assert ',"",' in line
+
+    def test_failed_merge_rolls_back_to_last_checkpoint(self):
+        conn = FakeConnection()
+        writer = DecisionWriter(conn, batch_size=2, checkpoint_every=1)
+        for i in range(2):
+            writer.add(_make_result(i), timestamp="2025-01-01T00:00:00")
+        conn.fail_merge = True
+        writer.add(_make_result(2), timestamp="2025-01-01T00:00:00")
+        with pytest.raises(RuntimeError):
+            writer.add(_make_result(3), timestamp="2025-01-01T00:00:00")
+        assert conn.rollbacks == 1
+        assert writer.stats["rows_committed"] == 2
+        assert writer.stats["rows_written"] == 2
+        assert len(conn.committed) == 2
+
+    def test_exit_with_exception_rolls_back(self):
+        conn = FakeConnection()
+        with pytest.raises(KeyError):
+            with DecisionWriter(conn, batch_size=1, checkpoint_every=10) as writer:
+                writer.add(_make_result(1), timestamp="2025-01-01T00:00:00")
+                raise KeyError("boom")
+        assert conn.rollbacks == 1
+        assert conn.committed == []
+        assert writer.stats["rows_committed"] == 0
+
+    def test_exit_cleanly_flushes(self):
+        conn = FakeConnection()
+        with DecisionWriter(conn, batch_size=10) as writer:
+            writer.add(_make_result(1), timestamp="2025-01-01T00:00:00")
+        assert len(conn.committed) == 1
+        assert writer.stats["rows_committed"] == 1
+
+    def test_invalid_batch_size(self):
+        with pytest.raises(ValueError):
+            DecisionWriter(FakeConnection(), batch_size=0)
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
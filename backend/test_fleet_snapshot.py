@@ -0,0 +1,220 @@
+"""
+Unit tests for the local columnar fleet snapshot (stub cursor, no database).
+
+Run with:
+    cd backend && python -m pytest test_fleet_snapshot.py -v
+"""
+
+import fcntl
+import json
+import os
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+import numpy as np
+import pytest
+
+from fleet_snapshot import (
+    TextColumn,
+    _decode,
+    _encode,
+    _infer_kind,
+    export_snapshot,
+    load_snapshot,
+    read_manifest,
+    refresh_snapshot,
+)
+from server import _row_to_dict
+
+T0 = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+
+# ── Fixtures ──────────────────────────────────────────────────────────
+
+def _make_rows(n, start=0):
+    return [
+        {
+            "truck_id": i % 3,
+            "ts": T0 + timedelta(minutes=i),
+            "temperature_c": Decimal("3.5") if i % 2 else None,
+            "door_open": i % 2,
+            "recommended_action": "continue",
+            "all_actions": {"a": i},
+            "flag": True,
+            "nothing": None,
+        }
+        for i in range(start, start + n)
+    ]
+
+
+class StubCursor:
+    def __init__(self, table):
+        self.table = table
+        self.description = None
+        self.rows = []
+        self.itersize = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query, params=()):
+        since = params[0] if params else None
+        self.rows = [r for r in self.table if since is None or r["ts"] >= since]
+        self.description = [(k,) for k in self.table[0]]
+
+    def fetchmany(self, n):
+        batch, self.rows = self.rows[:n], self.rows[n:]
+        return batch
+
+
+class StubConnection:
+    def __init__(self, table):
+        self.table = table
+        self.queries = 0
+
+    def cursor(self, name=None):
+        self.queries += 1
+        return StubCursor(self.table)
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def snap_dir(tmp_path):
+    return str(tmp_path / "snapshot")
+
+
+# ── Tests: encode / decode ────────────────────────────────────────────
+
+class TestEncodeDecode:
+    @pytest.mark.parametrize("values, kind", [
+        ([1, None, 3], "int"),
+        ([1.5, None, Decimal("2.25"), 4], "float"),
+        ([True, None, False], "bool"),
+        ([T0, None, T0 + timedelta(hours=1)], "datetime_tz"),
+        ([datetime(2025, 1, 1), None], "datetime"),
+        (["a", None, "bcd"], "str"),
+        (["", None, "héllo €", "x" * 1000], "str"),
+        ([{"a": 1}, None, [1, 2]], "json"),
+        ([None, None], "null"),
+    ])
+    def test_round_trip_matches_server_serialize(self, values, kind):
+        assert _infer_kind(values) == kind
+        arr, mask = _encode(values, kind)
+        assert mask is None or mask.tolist() == [v is None for v in values]
+        expected = [_row_to_dict({"v": v})["v"] for v in values]
+        assert _decode(arr, mask, kind) == expected
+
+    def test_aware_datetimes_stored_as_utc(self):
+        plus2 = timezone(timedelta(hours=2))
+        arr, _ = _encode([datetime(2025, 1, 1, 12, tzinfo=plus2)], "datetime_tz")
+        assert _decode(arr, None, "datetime_tz") == ["2025-01-01T10:00:00+00:00"]
+
+    def test_text_stored_variable_width(self):
+        values = ["x" * 10_000] + ["y"] * 999
+        arr, _ = _encode(values, "str")
+        assert isinstance(arr, TextColumn)
+        assert arr.data.nbytes == 10_000 + 999
+        assert arr.offsets.tolist()[:3] == [0, 10_000, 10_001]
+        keep = np.zeros(len(values), dtype=bool)
+        keep[[0, 5]] = True
+        assert TextColumn.concatenate(arr[keep], arr[keep]).tolist() == [values[0], "y"] * 2
+
+    def test_kind_mismatch_raises(self):
+        with pytest.raises(TypeError):
+            _encode([1, 2.5], "int")
+        with pytest.raises(TypeError):
+            _encode([{"a": 1}], "str")
+
+
+# ── Tests: export / refresh ───────────────────────────────────────────
+
+class TestSnapshot:
+    def test_export_matches_db_path(self, snap_dir):
+        table = _make_rows(10)
+        manifest = export_snapshot(StubConnection(table), snap_dir)
+        assert manifest["row_count"] == 10
+        assert manifest["high_water_mark"] == (T0 + timedelta(minutes=9)).isoformat()
+        snap = load_snapshot(snap_dir)
+        assert isinstance(snap.columns["truck_id"], np.memmap)
+        assert snap.rows() == [_row_to_dict(r) for r in table]
+
+    def test_incremental_refresh_at_high_water_mark(self, snap_dir):
+        table = _make_rows(10)
+        export_snapshot(StubConnection(table), snap_dir)
+        # A late row at exactly the mark plus a newer one
+        table += [
+            {**table[0], "truck_id": 7, "ts": T0 + timedelta(minutes=9)},
+            *_make_rows(1, start=20),
+        ]
+        manifest = refresh_snapshot(StubConnection(table), snap_dir)
+        assert manifest["version"] == 2
+        assert manifest["row_count"] == 12
+        assert manifest["high_water_mark"] == (T0 + timedelta(minutes=20)).isoformat()
+        assert load_snapshot(snap_dir).rows() == [_row_to_dict(r) for r in table]
+
+    def test_refresh_without_new_rows_only_touches_manifest(self, snap_dir):
+        table = _make_rows(5)
+        first = export_snapshot(StubConnection(table), snap_dir)
+        manifest = refresh_snapshot(StubConnection(table), snap_dir)
+        assert manifest["version"] == first["version"]
+        assert manifest["refreshed_at_epoch"] >= first["refreshed_at_epoch"]
+        assert read_manifest(snap_dir)["version"] == first["version"]
+
+    def test_kind_mismatch_falls_back_to_full_export(self, snap_dir):
+        table = _make_rows(5)
+        export_snapshot(StubConnection(table), snap_dir)
+        table.append({**_make_rows(1, start=10)[0], "nothing": 5})
+        manifest = refresh_snapshot(StubConnection(table), snap_dir)
+        kinds = {c["name"]: c["kind"] for c in manifest["columns"]}
+        assert kinds["nothing"] == "int"
+        assert manifest["row_count"] == 6
+        assert manifest["exported_at"] == manifest["refreshed_at"]
+
+    def test_fresh_snapshot_skips_refresh_under_lock(self, snap_dir):
+        table = _make_rows(5)
+        export_snapshot(StubConnection(table), snap_dir)
+        conn = StubConnection(table)
+        refresh_snapshot(conn, snap_dir, max_age=60)
+        assert conn.queries == 0
+
+    def test_text_columns_memory_mapped(self, snap_dir):
+        export_snapshot(StubConnection(_make_rows(3)), snap_dir)
+        col = load_snapshot(snap_dir).columns["recommended_action"]
+        assert isinstance(col, TextColumn)
+        assert isinstance(col.data, np.memmap) and isinstance(col.offsets, np.memmap)
+        assert col.tolist() == ["continue"] * 3
+
+    def test_old_format_manifest_ignored(self, snap_dir):
+        table = _make_rows(3)
+        manifest = export_snapshot(StubConnection(table), snap_dir)
+        with open(os.path.join(snap_dir, "manifest.json"), "w") as f:
+            json.dump({**manifest, "format": 1}, f)
+        assert read_manifest(snap_dir) is None
+        assert refresh_snapshot(StubConnection(table), snap_dir)["version"] == 2
+
+    def test_no_wait_returns_current_manifest_when_locked(self, snap_dir):
+        table = _make_rows(3)
+        first = export_snapshot(StubConnection(table), snap_dir)
+        conn = StubConnection(table + _make_rows(1, start=10))
+        with open(os.path.join(snap_dir, ".lock"), "w") as held:
+            fcntl.flock(held, fcntl.LOCK_EX)
+            assert refresh_snapshot(conn, snap_dir, wait=False) == first
+        assert conn.queries == 0
+
+    def test_old_versions_pruned(self, snap_dir):
+        table = _make_rows(3)
+        export_snapshot(StubConnection(table), snap_dir)
+        for i in range(3):
+            table += _make_rows(1, start=10 + i)
+            refresh_snapshot(StubConnection(table), snap_dir)
+        versions = sorted(e for e in os.listdir(snap_dir) if e.startswith("v"))
+        assert versions == ["v3", "v4"]
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
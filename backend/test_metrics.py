@@ -0,0 +1,175 @@
+"""
+Unit tests for the in-process metrics registry and request timing helpers.
+
+Run with:
+    cd backend && python -m pytest test_metrics.py -v
+"""
+
+import os
+
+import pytest
+
+import metrics
+from metrics import DEFAULT_BUCKETS, Registry, RequestProfiler, server_timing_header
+
+
+def _series(text, prefix):
+    """{line-without-value: value} for the rendered lines starting with prefix."""
+    out = {}
+    for line in text.splitlines():
+        if line.startswith(prefix):
+            key, value = line.rsplit(" ", 1)
+            out[key] = float(value)
+    return out
+
+
+# ── Tests: Registry.render ────────────────────────────────────────────
+
+class TestRender:
+    def test_histogram_buckets_are_cumulative(self):
+        reg = Registry()
+        for value in (0.0004, 0.003, 0.003, 0.2, 100.0):
+            reg.observe("lat", value, stage="db")
+        text = reg.render()
+
+        assert "# TYPE lat histogram" in text
+        buckets = _series(text, "lat_bucket")
+        assert len(buckets) == len(DEFAULT_BUCKETS) + 1
+        assert buckets['lat_bucket{stage="db",le="0.0005"}'] == 1
+        assert buckets['lat_bucket{stage="db",le="0.001"}'] == 1
+        assert buckets['lat_bucket{stage="db",le="0.005"}'] == 3
+        assert buckets['lat_bucket{stage="db",le="0.25"}'] == 4
+        assert buckets['lat_bucket{stage="db",le="30"}'] == 4
+        # Values above the last bound only show up in +Inf
+        assert buckets['lat_bucket{stage="db",le="+Inf"}'] == 5
+        values = list(buckets.values())
+        assert values == sorted(values)
+
+    def test_histogram_sum_and_count(self):
+        reg = Registry()
+        reg.observe("lat", 0.25)
+        reg.observe("lat", 0.5)
+        text = reg.render()
+        assert _series(text, "lat_sum") == {"lat_sum": 0.75}
+        assert _series(text, "lat_count") == {"lat_count": 2}
+        assert 'lat_bucket{le="+Inf"} 2' in text
+
+    def test_counters_with_help_and_sorted_labels(self):
+        reg = Registry()
+        reg.inc("fleet_requests_total", endpoint="a", status="200")
+        reg.inc("fleet_requests_total", 2, status="200", endpoint="a")
+        text = reg.render()
+        assert "# HELP fleet_requests_total HTTP requests by endpoint and status" in text
+        assert "# TYPE fleet_requests_total counter" in text
+        assert 'fleet_requests_total{endpoint="a",status="200"} 3' in text
+
+    def test_large_counters_rendered_exactly(self):
+        reg = Registry()
+        reg.inc("fleet_response_bytes_total", 123_456_789)
+        reg.inc("fleet_response_bytes_total", 1)
+        reg.inc("ratio", 0.1)
+        text = reg.render()
+        assert "fleet_response_bytes_total 123456790\n" in text
+        assert "ratio 0.1\n" in text
+
+    def test_histogram_summary_per_label(self):
+        reg = Registry()
+        reg.observe("lat", 0.5, stage="a")
+        reg.observe("lat", 0.25, stage="a")
+        reg.observe("lat", 1.0, stage="b")
+        assert reg.histogram_summary("lat", "stage") == {"a": (2, 0.75), "b": (1, 1.0)}
+        assert reg.histogram_summary("missing", "stage") == {}
+
+    def test_reset(self):
+        reg = Registry()
+        reg.inc("c")
+        reg.reset()
+        assert reg.render() == "\n"
+
+
+# ── Tests: Server-Timing ──────────────────────────────────────────────
+
+class TestServerTiming:
+    def test_sums_repeated_stages_in_first_seen_order(self):
+        header = server_timing_header([("db", 0.001), ("serialize", 0.0025), ("db", 0.002)])
+        assert header == "db;dur=3.00, serialize;dur=2.50"
+
+    def test_empty(self):
+        assert server_timing_header([]) == ""
+
+    def test_stage_collects_request_timings(self):
+        metrics.start_request_timings()
+        with metrics.stage("work"):
+            pass
+        timings = metrics.pop_request_timings()
+        assert [name for name, _ in timings] == ["work"]
+        assert metrics.pop_request_timings() == []
+
+
+# ── Tests: disabled ───────────────────────────────────────────────────
+
+class TestDisabled:
+    def test_timed_returns_function_unwrapped(self, monkeypatch):
+        monkeypatch.setattr(metrics, "ENABLED", False)
+
+        def fn():
+            return 1
+
+        assert metrics.timed("x")(fn) is fn
+
+    def test_stage_and_count_record_nothing(self, monkeypatch):
+        monkeypatch.setattr(metrics, "ENABLED", False)
+        monkeypatch.setattr(metrics, "REGISTRY", Registry())
+        with metrics.stage("x"):
+            pass
+        metrics.count("c")
+        metrics.observe("h", 1.0)
+        assert metrics.REGISTRY.render() == "\n"
+
+
+# ── Tests: RequestProfiler ────────────────────────────────────────────
+
+class TestRequestProfiler:
+    @pytest.mark.parametrize("mode, suffix", [("cpu", ".prof"), ("mem", ".tracemalloc.txt")])
+    def test_dump_written(self, mode, suffix, tmp_path, monkeypatch):
+        monkeypatch.setattr(metrics, "PROFILE_DIR", str(tmp_path))
+        path = RequestProfiler(mode, "label").start().stop()
+        assert path.endswith(suffix)
+        assert os.path.basename(path).startswith("label-")
+        assert os.path.exists(path)
+
+    @pytest.mark.parametrize("first, second", [("mem", "mem"), ("cpu", "cpu"), ("mem", "cpu")])
+    def test_overlapping_profile_skipped(self, first, second, tmp_path, monkeypatch):
+        monkeypatch.setattr(metrics, "PROFILE_DIR", str(tmp_path))
+        running = RequestProfiler(first).start()
+        assert RequestProfiler(second).start() is None
+        running.stop()
+        RequestProfiler(second).start().stop()
+
+    def test_unknown_mode(self):
+        with pytest.raises(ValueError):
+            RequestProfiler("disk")
+
+
+# ── Tests: dump at exit ───────────────────────────────────────────────
+
+class TestDump:
+    def test_dump_registry_to_file(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(metrics, "REGISTRY", Registry())
+        metrics.count("engine_mc_samples_total", 20_000)
+        out = tmp_path / "metrics.txt"
+        metrics.dump_registry(str(out))
+        assert "engine_mc_samples_total 20000" in out.read_text()
+
+    def test_dump_at_exit_only_when_requested(self, monkeypatch):
+        registered = []
+        monkeypatch.setattr(metrics.atexit, "register", lambda *a: registered.append(a))
+        monkeypatch.delenv("METRICS_DUMP", raising=False)
+        metrics.dump_at_exit()
+        monkeypatch.setenv("METRICS_DUMP", "stderr")
+        metrics.dump_at_exit()
+        assert registered == [(metrics.dump_registry, "stderr")]
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,146 @@
+"""
+Tests for the Flask fleet API (no database needed).
+
+Run with:
+    cd backend && python -m pytest test_server.py -v
+"""
+
+import os
+
+import pytest
+
+import metrics
+import server
+from fleet_snapshot import export_snapshot
+from test_fleet_snapshot import StubConnection, _make_rows
+
+
+@pytest.fixture
+def client():
+    return server.app.test_client()
+
+
+# ── Tests: snapshot-backed /api/fleet-data ────────────────────────────
+
+def _unreachable():
+    raise ConnectionError("database unreachable")
+
+
+@pytest.fixture
+def snapshot(tmp_path, monkeypatch):
+    snap_dir = str(tmp_path / "snapshot")
+    export_snapshot(StubConnection(_make_rows(4)), snap_dir)
+    monkeypatch.setattr(server, "SNAPSHOT_DIR", snap_dir)
+    monkeypatch.setattr(server, "_snapshot_cache", {"version": None, "rows": None})
+    monkeypatch.setattr(server, "get_db_connection", _unreachable)
+    return snap_dir
+
+
+def _join_refresh():
+    if server._refresh_thread is not None:
+        server._refresh_thread.join(timeout=5)
+
+
+class TestFleetDataSnapshot:
+    def test_fresh_snapshot_reports_age(self, client, snapshot):
+        resp = client.get("/api/fleet-data")
+        assert resp.status_code == 200
+        assert len(resp.get_json()["rows"]) == 4
+        assert resp.headers["X-Snapshot-Age"] == "0"
+
+    def test_stale_snapshot_served_while_background_refresh_fails(
+        self, client, snapshot, monkeypatch,
+    ):
+        monkeypatch.setattr(metrics, "REGISTRY", metrics.Registry())
+        monkeypatch.setattr(server, "SNAPSHOT_MAX_AGE", -1.0)
+        resp = client.get("/api/fleet-data")
+        _join_refresh()
+        assert resp.status_code == 200
+        assert len(resp.get_json()["rows"]) == 4
+        assert "X-Snapshot-Age" in resp.headers
+        assert "fleet_snapshot_refresh_errors_total 1" in metrics.REGISTRY.render()
+
+    def test_background_refresh_picks_up_new_rows(self, client, snapshot, monkeypatch):
+        table = _make_rows(4)
+        monkeypatch.setattr(server, "SNAPSHOT_MAX_AGE", -1.0)
+        monkeypatch.setattr(server, "get_db_connection", lambda: StubConnection(table))
+        table += _make_rows(2, start=10)
+        # Served without waiting for the refresh, which may or may not have landed yet
+        assert client.get("/api/fleet-data").status_code == 200
+        _join_refresh()
+        assert len(client.get("/api/fleet-data").get_json()["rows"]) == 6
+
+    def test_past_max_stale_and_refresh_fails_is_503(self, client, snapshot, monkeypatch):
+        monkeypatch.setattr(server, "SNAPSHOT_MAX_STALE", -1.0)
+        resp = client.get("/api/fleet-data")
+        assert resp.status_code == 503
+        assert "unreachable" in resp.get_json()["error"]
+        assert "X-Snapshot-Age" in resp.headers
+
+    def test_missing_snapshot_and_no_database_is_an_error(self, client, tmp_path, monkeypatch):
+        monkeypatch.setattr(server, "SNAPSHOT_DIR", str(tmp_path / "empty"))
+        monkeypatch.setattr(server, "get_db_connection", _unreachable)
+        resp = client.get("/api/fleet-data")
+        assert resp.status_code == 500
+        assert "unreachable" in resp.get_json()["error"]
+
+
+# ── Tests: instrumentation ────────────────────────────────────────────
+
+class TestInstrumentation:
+    @pytest.fixture(autouse=True)
+    def fresh_registry(self, monkeypatch):
+        monkeypatch.setattr(metrics, "ENABLED", True)
+        monkeypatch.setattr(metrics, "REGISTRY", metrics.Registry())
+
+    def test_metrics_endpoint_renders_request_metrics(self, client):
+        client.get("/health")
+        resp = client.get("/metrics")
+        assert resp.status_code == 200
+        assert resp.mimetype == "text/plain"
+        text = resp.get_data(as_text=True)
+        assert 'fleet_requests_total{endpoint="health",status="200"} 1' in text
+        assert 'fleet_request_duration_seconds_count{endpoint="health"} 1' in text
+
+    def test_timing_query_adds_server_timing(self, client, snapshot):
+        resp = client.get("/api/fleet-data?timing=1")
+        assert resp.status_code == 200
+        names = [part.split(";")[0] for part in resp.headers["Server-Timing"].split(", ")]
+        assert "snapshot_load" in names
+        assert names[-1] == "total"
+
+        assert "Server-Timing" not in client.get("/health").headers
+
+    def test_profiler_stopped_when_request_raises(self, client, tmp_path, monkeypatch):
+        monkeypatch.setattr(metrics, "PROFILING_ENABLED", True)
+        monkeypatch.setattr(metrics, "PROFILE_DIR", str(tmp_path))
+        stopped = []
+        real_stop = metrics.RequestProfiler.stop
+
+        def stop(self):
+            stopped.append(self.mode)
+            return real_stop(self)
+
+        def explode():
+            raise RuntimeError("boom")
+
+        monkeypatch.setattr(metrics.RequestProfiler, "stop", stop)
+        monkeypatch.setitem(server.app.view_functions, "health", explode)
+        # Propagating exceptions skips after_request; teardown still runs
+        monkeypatch.setitem(server.app.config, "PROPAGATE_EXCEPTIONS", True)
+        with pytest.raises(RuntimeError):
+            client.get("/health?profile=cpu")
+        assert stopped == ["cpu"]
+        assert [p for p in os.listdir(tmp_path) if p.endswith(".prof")]
+
+    def test_profile_dump_path_not_sent_to_client(self, client, tmp_path, monkeypatch):
+        monkeypatch.setattr(metrics, "PROFILING_ENABLED", True)
+        monkeypatch.setattr(metrics, "PROFILE_DIR", str(tmp_path))
+        resp = client.get("/health?profile=mem")
+        assert resp.status_code == 200
+        assert str(tmp_path) not in str(resp.headers)
+        assert [p for p in os.listdir(tmp_path) if p.endswith(".tracemalloc.txt")]
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])